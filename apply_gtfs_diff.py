@@ -7,7 +7,7 @@ It handles both updates to existing records and deletions.
 The script processes files in the following order:
 1. Independent entities (agencies, stops)
 2. Routes (depends on agencies)
-3. Dependent entities (trips, stop times, calendar, etc.)
+3. Dependent entities (calendar, trips, stop times, etc.)
 
 For each file type:
 1. Reads the .changes.csv file to get modified/added records
@@ -17,6 +17,8 @@ For each file type:
 Usage:
     python apply_gtfs_diff.py diff.zip
 
+apply_diff_to_cache applies the same diff to the cache files.
+
 The script will:
 1. Load the diff zip file
 2. Process each file type in the correct order
@@ -25,22 +27,29 @@ The script will:
 
 Dependencies:
 - supabase: For database operations
+- pyarrow (optional): For fast CSV parsing
+- orjson: For reading the diff summary
 - gtfs_utils: For shared GTFS processing functions
 """
 
 import csv
 import io
-import json
+import os
 import zipfile
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
 
+import orjson
 from supabase import Client
 
 from gtfs_utils import (
     create_supabase_client,
     process_batch,
     delete_records,
+    iter_csv_batches,
+    as_records,
+    convert_numeric_columns,
     parse_agency,
     parse_stops,
     parse_calendar,
@@ -50,10 +59,22 @@ from gtfs_utils import (
     parse_calendar_dates,
     parse_transfers,
     parse_shapes,
-    GTFS_TO_TABLE
+    GTFS_TO_TABLE,
+    TABLE_KEY_COLUMNS,
+    UPLOAD_BATCH_SIZE
 )
-from load_gtfs_cache import load_cache
+from load_gtfs_cache import CACHE_SUFFIX, find_cache_file, iter_cache, load_cache_column
+from save_gtfs_cache import remove_legacy_cache, write_cache_file
 
+# Tables that other tables reference, mapped to the field holding their IDs
+# and the cache parameter those IDs are collected in
+PARENT_ID_COLUMNS = {
+    "agencies": ("id", "agency_ids"),
+    "stops": ("id", "stop_ids"),
+    "routes": ("id", "route_ids"),
+    "calendars": ("service_id", "service_ids"),
+    "trips": ("id", "trip_ids"),
+}
 
 def get_cache_dir() -> Path:
     """
@@ -87,224 +108,384 @@ def process_diff_zip(diff_zip_path: str) -> None:
     # Create Supabase client
     supabase = create_supabase_client()
     
-    # Load summary
+    # Open the diff zip once for the whole run
     with zipfile.ZipFile(diff_zip_path) as diff_zip:
-        summary = json.loads(diff_zip.read("summary.json").decode('utf-8'))
-    
-    if not summary.get("has_changes", False):
-        print("No changes found in diff zip")
-        return
-    
-    # Get cache directory
-    cache_dir = get_cache_dir()
-    
-    # Load cache data for dependencies
-    print("Loading cache data for dependencies...")
-    cache_data = load_cache(cache_dir)
-    
-    # Process files in order of dependencies
-    process_independent_entities(diff_zip_path, supabase, cache_data)
-    process_routes(diff_zip_path, supabase, cache_data)
-    process_dependent_entities(diff_zip_path, supabase, cache_data)
+        # Load summary
+        summary = orjson.loads(diff_zip.read("summary.json"))
+        
+        if not summary.get("has_changes", False):
+            print("No changes found in diff zip")
+            return
+        
+        # Get cache directory
+        cache_dir = get_cache_dir()
+        
+        # Load cache data for dependencies
+        print("Loading cache data for dependencies...")
+        cache_params = build_cache_params(cache_dir)
+        
+        # Member names, looked up once per file type below
+        members = frozenset(diff_zip.namelist())
+        
+        # Process files in order of dependencies
+        process_independent_entities(diff_zip, members, supabase, cache_params)
+        process_routes(diff_zip, members, supabase, cache_params)
+        process_dependent_entities(diff_zip, members, supabase, cache_params)
     
     print("Diff processing completed successfully")
 
-def process_independent_entities(diff_zip_path: str, supabase: Client, cache_data: Dict[str, List[Dict[str, Any]]]) -> None:
+def process_independent_entities(diff_zip: zipfile.ZipFile, members: FrozenSet[str], supabase: Client, cache_params: Dict[Callable, Dict[str, Any]]) -> None:
     """
     Process independent entities (agencies, stops) from the diff zip.
     
     Args:
-        diff_zip_path: Path to the diff zip file
+        diff_zip: Open diff zip file
+        members: Names of the files in the diff zip
         supabase: Supabase client instance
-        cache_data: Dictionary of cached data
+        cache_params: Cache parameters for each parse function
     """
     print("\nProcessing independent entities...")
     
     # Process agencies
     if "agency.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "agency.txt",
             parse_agency,
             supabase,
-            cache_data
+            cache_params
         )
     
     # Process stops
     if "stops.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "stops.txt",
             parse_stops,
             supabase,
-            cache_data
+            cache_params
         )
 
-def process_routes(diff_zip_path: str, supabase: Client, cache_data: Dict[str, List[Dict[str, Any]]]) -> None:
+def process_routes(diff_zip: zipfile.ZipFile, members: FrozenSet[str], supabase: Client, cache_params: Dict[Callable, Dict[str, Any]]) -> None:
     """
     Process routes from the diff zip.
     
     Args:
-        diff_zip_path: Path to the diff zip file
+        diff_zip: Open diff zip file
+        members: Names of the files in the diff zip
         supabase: Supabase client instance
-        cache_data: Dictionary of cached data
+        cache_params: Cache parameters for each parse function
     """
     print("\nProcessing routes...")
     
     if "routes.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "routes.txt",
             parse_routes,
             supabase,
-            cache_data
+            cache_params
         )
 
-def process_dependent_entities(diff_zip_path: str, supabase: Client, cache_data: Dict[str, List[Dict[str, Any]]]) -> None:
+def process_dependent_entities(diff_zip: zipfile.ZipFile, members: FrozenSet[str], supabase: Client, cache_params: Dict[Callable, Dict[str, Any]]) -> None:
     """
     Process dependent entities (trips, stop times, etc.) from the diff zip.
     
     Args:
-        diff_zip_path: Path to the diff zip file
+        diff_zip: Open diff zip file
+        members: Names of the files in the diff zip
         supabase: Supabase client instance
-        cache_data: Dictionary of cached data
+        cache_params: Cache parameters for each parse function
     """
     print("\nProcessing dependent entities...")
     
+    # Process calendar first, since trips and calendar dates reference it
+    if "calendar.txt" in GTFS_TO_TABLE:
+        process_file_changes(
+            diff_zip,
+            members,
+            "calendar.txt",
+            parse_calendar,
+            supabase,
+            cache_params
+        )
+    
     # Process trips
     if "trips.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "trips.txt",
             parse_trips,
             supabase,
-            cache_data
+            cache_params
         )
     
     # Process stop times
     if "stop_times.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "stop_times.txt",
             parse_stop_times,
             supabase,
-            cache_data
-        )
-    
-    # Process calendar
-    if "calendar.txt" in GTFS_TO_TABLE:
-        process_file_changes(
-            diff_zip_path,
-            "calendar.txt",
-            parse_calendar,
-            supabase,
-            cache_data
+            cache_params
         )
     
     # Process calendar dates
     if "calendar_dates.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "calendar_dates.txt",
             parse_calendar_dates,
             supabase,
-            cache_data
+            cache_params
         )
     
     # Process transfers
     if "transfers.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "transfers.txt",
             parse_transfers,
             supabase,
-            cache_data
+            cache_params
         )
     
     # Process shapes
     if "shapes.txt" in GTFS_TO_TABLE:
         process_file_changes(
-            diff_zip_path,
+            diff_zip,
+            members,
             "shapes.txt",
             parse_shapes,
             supabase,
-            cache_data
+            cache_params
         )
 
 def process_file_changes(
-    diff_zip_path: str,
+    diff_zip: zipfile.ZipFile,
+    members: FrozenSet[str],
     filename: str,
     parse_func,
     supabase: Client,
-    cache_data: Dict[str, List[Dict[str, Any]]]
+    cache_params: Dict[Callable, Dict[str, Any]]
 ) -> None:
     """
     Process changes for a specific file type.
     
     Args:
-        diff_zip_path: Path to the diff zip file
+        diff_zip: Open diff zip file
+        members: Names of the files in the diff zip
         filename: Name of the file to process
         parse_func: Function to parse records from the file
         supabase: Supabase client instance
-        cache_data: Dictionary of cached data
+        cache_params: Cache parameters for each parse function
     """
     print(f"\nProcessing {filename}...")
     
+    # Process changed records
+    changes_filename = f"{filename}.changes.csv"
+    if changes_filename in members:
+        print(f"Processing changes in {changes_filename}")
+        params = cache_params.get(parse_func, {})
+        pending = []
+        with diff_zip.open(changes_filename) as f:
+            # Parse one batch at a time, uploading only once a full upsert batch has accumulated
+            for data in iter_csv_batches(f):
+                records = parse_func(data, **params)
+                add_parent_ids(cache_params, GTFS_TO_TABLE[filename], records)
+                pending.extend(records)
+                if len(pending) >= UPLOAD_BATCH_SIZE:
+                    process_batch(supabase, GTFS_TO_TABLE[filename], pending[:UPLOAD_BATCH_SIZE])
+                    del pending[:UPLOAD_BATCH_SIZE]
+        
+        # Flush the remainder before moving on, so dependent tables see these rows
+        if pending:
+            process_batch(supabase, GTFS_TO_TABLE[filename], pending)
+    
+    # Process deleted records
+    deletions_filename = f"{filename}.deletions.csv"
+    if deletions_filename in members:
+        print(f"Processing deletions in {deletions_filename}")
+        with diff_zip.open(deletions_filename) as f:
+            reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8'))
+            header = next(reader)  # Skip header
+            keys = list(reader)
+            if keys:
+                delete_records(keys, GTFS_TO_TABLE[filename], supabase)
+
+def apply_file_to_cache(
+    diff_zip: zipfile.ZipFile,
+    members: FrozenSet[str],
+    filename: str,
+    parse_func,
+    cache_dir: Path,
+    cache_params: Dict[Callable, Dict[str, Any]]
+) -> None:
+    """
+    Apply the changes for a specific file type to its table's cache file.
+    
+    The cache file is streamed through a merge with the diff, keyed on the
+    table's primary key, into a new cache file that then replaces it. Only
+    the changed records and deleted keys are held in memory. A table with no
+    cache file is treated as empty.
+    
+    Args:
+        diff_zip: Open diff zip file
+        members: Names of the files in the diff zip
+        filename: Name of the file to process
+        parse_func: Function to parse records from the file
+        cache_dir: Directory containing cache files
+        cache_params: Cache parameters for each parse function
+    """
+    changes_filename = f"{filename}.changes.csv"
+    deletions_filename = f"{filename}.deletions.csv"
+    if changes_filename not in members and deletions_filename not in members:
+        return
+    
+    table_name = GTFS_TO_TABLE[filename]
+    # A table without a cache file had no rows when the cache was last saved
+    has_cache = find_cache_file(table_name, cache_dir) is not None
+    
+    # itemgetter returns the bare value for single-column keys and a tuple otherwise
+    get_key = itemgetter(*TABLE_KEY_COLUMNS.get(table_name, ["id"]))
+    
+    # Parse changed records exactly as they were uploaded
+    changed = {}
+    if changes_filename in members:
+        params = cache_params.get(parse_func, {})
+        with diff_zip.open(changes_filename) as f:
+            for data in iter_csv_batches(f):
+                records = as_records(parse_func(data, **params))
+                add_parent_ids(cache_params, table_name, records)
+                for record in records:
+                    changed[get_key(record)] = record
+    
+    # Deleted keys are in primary key order, as strings; convert them to match the cache
+    deleted = set()
+    if deletions_filename in members:
+        with diff_zip.open(deletions_filename) as f:
+            reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+            header = next(reader)
+            keys = [row for row in reader if row]
+        convert_numeric_columns(header, keys)
+        deleted = {key[0] if len(key) == 1 else tuple(key) for key in keys}
+    
+    num_changed, num_deleted = len(changed), len(deleted)
+    
+    def merged_records():
+        if has_cache:
+            for record in iter_cache(table_name, cache_dir):
+                key = get_key(record)
+                if key not in deleted:
+                    yield changed.pop(key, record)
+        # Whatever is left was added by the diff
+        yield from changed.values()
+    
+    # write_cache_file replaces the cache file only once the merge has finished reading it
+    write_cache_file(os.path.join(cache_dir, f"{table_name}{CACHE_SUFFIX}"), merged_records())
+    remove_legacy_cache(table_name, cache_dir)
+    
+    print(f"Updated {table_name} cache: {num_changed} changed, {num_deleted} deleted")
+
+def apply_diff_to_cache(diff_zip_path: str, cache_dir: Optional[Path] = None) -> None:
+    """
+    Apply a GTFS diff zip file to the cache files, without reloading them from the database.
+    
+    Only tables with changes in the diff are rewritten. Changed records are
+    parsed with the same cache parameters as process_diff_zip, so run this
+    before the cache has been updated by anything else.
+    
+    Args:
+        diff_zip_path: Path to the diff zip file
+        cache_dir: Directory containing cache files; defaults to get_cache_dir()
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    
     with zipfile.ZipFile(diff_zip_path) as diff_zip:
-        # Process changed records
-        changes_filename = f"{filename}.changes.csv"
-        if changes_filename in diff_zip.namelist():
-            print(f"Processing changes in {changes_filename}")
-            with diff_zip.open(changes_filename) as f:
-                reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8'))
-                header = next(reader)
-                rows = list(reader)
-                
-                if rows:
-                    # Convert rows to dictionaries
-                    data = [dict(zip(header, row)) for row in rows]
-                    records = parse_func(data, **get_cache_params(parse_func, cache_data))
-                    if records:
-                        process_batch(supabase, GTFS_TO_TABLE[filename], records)
+        summary = orjson.loads(diff_zip.read("summary.json"))
         
-        # Process deleted records
-        deletions_filename = f"{filename}.deletions.csv"
-        if deletions_filename in diff_zip.namelist():
-            print(f"Processing deletions in {deletions_filename}")
-            with diff_zip.open(deletions_filename) as f:
-                reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8'))
-                header = next(reader)  # Skip header
-                keys = list(reader)
-                if keys:
-                    delete_records(keys, GTFS_TO_TABLE[filename], supabase)
+        if not summary.get("has_changes", False):
+            print("No changes found in diff zip")
+            return
+        
+        cache_params = build_cache_params(cache_dir)
+        members = frozenset(diff_zip.namelist())
+        
+        for filename, parse_func in [
+            ("agency.txt", parse_agency),
+            ("stops.txt", parse_stops),
+            ("routes.txt", parse_routes),
+            ("calendar.txt", parse_calendar),
+            ("trips.txt", parse_trips),
+            ("stop_times.txt", parse_stop_times),
+            ("calendar_dates.txt", parse_calendar_dates),
+            ("transfers.txt", parse_transfers),
+            ("shapes.txt", parse_shapes),
+        ]:
+            apply_file_to_cache(diff_zip, members, filename, parse_func, cache_dir, cache_params)
+    
+    print("Cache update completed successfully")
 
-def get_cache_params(parse_func, cache_data: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+def build_cache_params(cache_dir: Path) -> Dict[Callable, Dict[str, Any]]:
     """
-    Get the appropriate cache parameters for a parse function.
+    Build the cache parameters for every parse function that needs them.
+    
+    This runs once per run rather than once per file. Only the ID columns
+    are streamed from the cache, so large tables like stop_times are never
+    loaded. Each ID set is shared by every parse function that takes it, and
+    grows through add_parent_ids as parent tables are applied.
     
     Args:
-        parse_func: The parse function to get parameters for
-        cache_data: Dictionary of cached data
+        cache_dir: Directory containing cache files
         
     Returns:
-        Dictionary of parameters to pass to the parse function
+        Dictionary mapping parse functions to the parameters to pass them
     """
-    params = {}
-    
-    if parse_func == parse_routes:
-        params["agencies"] = cache_data.get("agencies", [])
-    elif parse_func == parse_trips:
-        params["routes"] = cache_data.get("routes", [])
-        params["service_ids"] = {c["service_id"] for c in cache_data.get("calendars", [])}
-    elif parse_func == parse_stop_times:
-        params["trips"] = cache_data.get("trips", [])
-        params["stops"] = cache_data.get("stops", [])
-    elif parse_func == parse_calendar_dates:
-        params["calendars"] = cache_data.get("calendars", [])
-    elif parse_func == parse_transfers:
-        params["stops"] = cache_data.get("stops", [])
-    
-    return params
+    # These sets are mutable and shared: add_parent_ids grows them as each parent
+    # table is applied, so parents must be processed before the tables that
+    # reference them (agencies before routes, calendar before trips and calendar dates)
+    ids = {
+        param: set(load_cache_column(table_name, field, cache_dir))
+        for table_name, (field, param) in PARENT_ID_COLUMNS.items()
+    }
+    
+    return {
+        parse_routes: {"agency_ids": ids["agency_ids"]},
+        parse_trips: {"route_ids": ids["route_ids"], "service_ids": ids["service_ids"]},
+        parse_stop_times: {"trip_ids": ids["trip_ids"], "stop_ids": ids["stop_ids"]},
+        parse_calendar_dates: {"service_ids": ids["service_ids"]},
+        parse_transfers: {"stop_ids": ids["stop_ids"]},
+    }
+
+def add_parent_ids(cache_params: Dict[Callable, Dict[str, Any]], table_name: str, records: List[Dict[str, Any]]) -> None:
+    """
+    Add the IDs of a parent table's changed records to the cache parameters.
+    
+    Rows added in the same diff as the route, trip, stop or service they
+    reference are then kept when the referencing table is parsed, rather
+    than skipped as pointing to a missing record.
+    
+    Args:
+        cache_params: Cache parameters for each parse function
+        table_name: Name of the table the records belong to
+        records: Parsed records of the table
+    """
+    if table_name not in PARENT_ID_COLUMNS:
+        return
+    field, param = PARENT_ID_COLUMNS[table_name]
+    for params in cache_params.values():
+        if param in params:
+            # The set is shared by every parse function that takes it
+            params[param].update(record[field] for record in records)
+            return
 
 if __name__ == "__main__":
     import sys
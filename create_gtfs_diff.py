@@ -26,26 +26,39 @@ Usage:
 
 The script will:
 1. Load and parse both GTFS zip files
-2. Compare records using primary keys and content hashes
+2. Compare records using primary keys and content hashes, one process per file
 3. Create a diff zip containing only the changes
 4. Generate a summary of all changes found
 
 Dependencies:
 - csv: For parsing GTFS CSV files
-- hashlib: For generating content hashes
+- xxhash: For generating content hashes
+- numba (optional): For compiling the record scanning loop
 - zipfile: For handling zip files
+- orjson: For writing the summary
 """
 
 import csv
-import hashlib
 import io
-import json
+import os
 import sys
 import time
 import zipfile
-from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
 
+import orjson
+import xxhash
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    # Fall back to the pure-Python record loop when numba is not installed
+    np = None
+    njit = None
+
 # Primary keys for each GTFS file type
 PRIMARY_KEYS = {
     "stops.txt": ["stop_id"],
@@ -58,54 +71,630 @@ PRIMARY_KEYS = {
     "transfers.txt": ["from_stop_id", "to_stop_id"],
 }
 
-def hash_row(row: List[str]) -> str:
-    """Generate an MD5 hash of a row's contents."""
-    return hashlib.md5(','.join(row).encode('utf-8')).hexdigest()
+# Files that are usually sorted by primary key and can be diffed with a
+# streaming merge, mapped to the primary key columns that sort numerically
+SORTED_FILES = {
+    "stop_times.txt": ["stop_sequence"],
+    "shapes.txt": ["shape_pt_sequence"],
+}
+
+# Compression methods accepted by --compression. The diff zip is applied
+# right after it is created, so it is stored uncompressed by default.
+COMPRESSION_METHODS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+# Buffer size for streaming CSV output into the diff zip
+ZIP_WRITE_BUFFER_SIZE = 1 << 20
+
+# Records located and hashed per call to the compiled scanner
+SCAN_CHUNK_RECORDS = 1 << 16
+
+class UnsortedFileError(ValueError):
+    """Raised when a file in SORTED_FILES is not actually sorted by primary key."""
+
+def hash_row(record: bytes) -> int:
+    """Generate a 64-bit xxHash of a raw CSV record."""
+    return xxhash.xxh3_64_intdigest(record)
+
+def iter_records(f: IO[bytes]) -> Iterator[bytes]:
+    """
+    Iterate over the raw records of a binary CSV stream.
+    
+    Line endings are stripped and empty lines are skipped. A line with an
+    unbalanced quote is joined with the following line(s), so quoted fields
+    containing newlines stay within a single record.
+    
+    Args:
+        f: Binary file object positioned at the start of a record
+        
+    Yields:
+        Each record as bytes, without its line ending
+    """
+    pending = b''
+    for line in f:
+        if pending:
+            line = pending + line
+            pending = b''
+        if line.count(b'"') % 2:
+            pending = line
+            continue
+        line = line.rstrip(b'\r\n')
+        if line:
+            yield line
+    if pending:
+        yield pending.rstrip(b'\r\n')
+
+def split_record(record: bytes) -> List[str]:
+    """Split a raw CSV record into its decoded fields."""
+    text = record.decode('utf-8')
+    if '"' in text:
+        return next(csv.reader([text]))
+    return text.split(',')
+
+def format_record(fields: List[str]) -> bytes:
+    """Format a list of fields as a raw CSV record, without its line ending."""
+    output = io.StringIO()
+    csv.writer(output, lineterminator='').writerow(fields)
+    return output.getvalue().encode('utf-8')
+
+def scan_records(buf, pk_indices, pos, max_records):
+    """
+    Locate and hash up to max_records records of a raw CSV buffer.
+    
+    Compiled with numba when it is installed. Records are split on newlines
+    outside quoted fields, trailing carriage returns are stripped and empty
+    lines are skipped, matching iter_records. Each record is hashed with
+    64-bit FNV-1a.
+    
+    Args:
+        buf: uint8 array holding the CSV data without its header
+        pk_indices: int64 array of primary key column indices
+        pos: Offset of the first record to scan
+        max_records: Maximum number of records to scan
+        
+    Returns:
+        Tuple containing:
+        - Number of records found
+        - Offset to continue scanning from; at or past the end of buf once
+          every record has been scanned
+        - Start and end offsets of each record
+        - Hash of each record
+        - Start and end offsets of each record's primary key cells
+        Arrays have max_records rows; only the first `count` rows are valid.
+    """
+    n = buf.shape[0]
+    num_keys = pk_indices.shape[0]
+    starts = np.zeros(max_records, np.int64)
+    ends = np.zeros(max_records, np.int64)
+    hashes = np.zeros(max_records, np.uint64)
+    key_starts = np.zeros((max_records, num_keys), np.int64)
+    key_ends = np.zeros((max_records, num_keys), np.int64)
+    
+    count = 0
+    start = pos
+    field = 0
+    field_start = pos
+    in_quotes = False
+    for i in range(pos, n + 1):
+        at_end = i == n
+        if not at_end:
+            c = buf[i]
+            if c == 34:  # '"'
+                in_quotes = not in_quotes
+                continue
+            if in_quotes or (c != 44 and c != 10):  # ',' and '\n'
+                continue
+        is_newline = at_end or buf[i] == 10
+        
+        # End of a field
+        end = i
+        if is_newline:
+            while end > start and buf[end - 1] == 13:  # '\r'
+                end -= 1
+        for j in range(num_keys):
+            if pk_indices[j] == field:
+                key_starts[count, j] = field_start
+                key_ends[count, j] = end
+        field += 1
+        field_start = i + 1
+        
+        # End of a record
+        if is_newline:
+            if end > start:
+                h = FNV_OFFSET_BASIS
+                for k in range(start, end):
+                    h = (h ^ np.uint64(buf[k])) * FNV_PRIME
+                starts[count] = start
+                ends[count] = end
+                hashes[count] = h
+                count += 1
+            start = i + 1
+            field = 0
+            in_quotes = False
+            if count == max_records:
+                break
+    
+    return count, start, starts, ends, hashes, key_starts, key_ends
+
+def parse_digits(buf, start, end):
+    """Parse buf[start:end] as a non-negative integer, or return -1 if it is not one."""
+    if end == start or end - start > 18:
+        return -1
+    value = 0
+    for i in range(start, end):
+        c = buf[i]
+        if c < 48 or c > 57:  # '0' to '9'
+            return -1
+        value = value * 10 + (c - 48)
+    return value
+
+def scan_sorted(buf, pk_indices, numeric):
+    """
+    Check that the records of a raw CSV buffer are strictly increasing by primary key.
+    
+    Compiled with numba. Records must not contain quoted fields. Key cells
+    flagged in numeric are compared as integers and all others byte by byte,
+    which orders UTF-8 text the same way as comparing Python strings.
+    
+    Args:
+        buf: uint8 array holding the CSV data without its header
+        pk_indices: int64 array of primary key column indices
+        numeric: bool array flagging the primary key columns that sort numerically
+        
+    Returns:
+        True if every record's key is greater than the previous one's
+    """
+    n = buf.shape[0]
+    num_keys = pk_indices.shape[0]
+    key_starts = np.zeros(num_keys, np.int64)
+    key_ends = np.zeros(num_keys, np.int64)
+    prev_starts = np.zeros(num_keys, np.int64)
+    prev_ends = np.zeros(num_keys, np.int64)
+    has_prev = False
+    
+    start = 0
+    while start < n:
+        end = start
+        while end < n and buf[end] != 10:  # '\n'
+            end += 1
+        next_start = end + 1
+        while end > start and buf[end - 1] == 13:  # '\r'
+            end -= 1
+        
+        if end > start:
+            # Locate the primary key cells
+            found = 0
+            field = 0
+            field_start = start
+            for i in range(start, end + 1):
+                if i == end or buf[i] == 44:  # ','
+                    for j in range(num_keys):
+                        if pk_indices[j] == field:
+                            key_starts[j] = field_start
+                            key_ends[j] = i
+                            found += 1
+                    field += 1
+                    field_start = i + 1
+            if found < num_keys:
+                return False
+            
+            # Compare with the previous record's key
+            order = 0
+            for j in range(num_keys):
+                if numeric[j]:
+                    value = parse_digits(buf, key_starts[j], key_ends[j])
+                    if value < 0:
+                        return False
+                    if has_prev and order == 0:
+                        prev_value = parse_digits(buf, prev_starts[j], prev_ends[j])
+                        order = -1 if prev_value < value else (1 if prev_value > value else 0)
+                elif has_prev and order == 0:
+                    length = min(key_ends[j] - key_starts[j], prev_ends[j] - prev_starts[j])
+                    for k in range(length):
+                        a = buf[prev_starts[j] + k]
+                        b = buf[key_starts[j] + k]
+                        if a != b:
+                            order = -1 if a < b else 1
+                            break
+                    if order == 0:
+                        a_len = prev_ends[j] - prev_starts[j]
+                        b_len = key_ends[j] - key_starts[j]
+                        order = -1 if a_len < b_len else (1 if a_len > b_len else 0)
+            if has_prev and order >= 0:
+                return False
+            
+            for j in range(num_keys):
+                prev_starts[j] = key_starts[j]
+                prev_ends[j] = key_ends[j]
+            has_prev = True
+        
+        start = next_start
+    
+    return True
+
+if njit is not None:
+    FNV_OFFSET_BASIS = np.uint64(0xcbf29ce484222325)
+    FNV_PRIME = np.uint64(0x100000001b3)
+    scan_records = njit(cache=True)(scan_records)
+    parse_digits = njit(cache=True)(parse_digits)
+    scan_sorted = njit(cache=True)(scan_sorted)
+
+def iter_indexed_records(body: bytes, pk_indices: List[int]) -> Iterator[Tuple[Tuple, bytes, int]]:
+    """
+    Yield each record's primary key, raw bytes and hash, one record at a time.
+    
+    Pure-Python counterpart of iter_indexed_records_compiled.
+    """
+    # Only split as far as the last primary key column
+    max_split = max(pk_indices, default=-1) + 1
+    
+    for record in iter_records(io.BytesIO(body)):
+        if b'"' in record:
+            fields = split_record(record)
+            pk_values = tuple(fields[i] for i in pk_indices)
+        else:
+            cells = record.split(b',', max_split)
+            pk_values = tuple(cells[i].decode('utf-8') for i in pk_indices)
+        yield pk_values, record, hash_row(record)
+
+def iter_indexed_records_compiled(body: bytes, pk_indices: List[int]) -> Iterator[Tuple[Tuple, bytes, int]]:
+    """
+    Yield each record's primary key, raw bytes and hash using scan_records.
+    
+    Record boundaries, primary key offsets and hashes are computed in
+    compiled passes of SCAN_CHUNK_RECORDS records, each scanned only once the
+    previous chunk has been consumed; Python only slices out the keys.
+    """
+    buf = np.frombuffer(body, dtype=np.uint8)
+    pk_array = np.array(pk_indices, dtype=np.int64)
+    pos = 0
+    
+    while pos < len(body):
+        count, pos, starts, ends, hashes, key_starts, key_ends = scan_records(
+            buf, pk_array, pos, SCAN_CHUNK_RECORDS
+        )
+        
+        for start, end, hash_val, record_key_starts, record_key_ends in zip(
+            starts[:count].tolist(),
+            ends[:count].tolist(),
+            hashes[:count].tolist(),
+            key_starts[:count].tolist(),
+            key_ends[:count].tolist()
+        ):
+            record = body[start:end]
+            if b'"' in record:
+                fields = split_record(record)
+                pk_values = tuple(fields[i] for i in pk_indices)
+            else:
+                pk_values = tuple(
+                    body[key_start:key_end].decode('utf-8')
+                    for key_start, key_end in zip(record_key_starts, record_key_ends)
+                )
+            yield pk_values, record, hash_val
+
+def read_csv(content: bytes, filename: str) -> Tuple[List[str], Iterator[Tuple[Tuple, bytes, int]]]:
+    """
+    Parse the header of a CSV file from a GTFS zip file and iterate over its records.
+    
+    Rows are kept as their raw bytes and hashed directly; only the primary
+    key cells are decoded. Uses the numba-compiled scanner when available.
+    Both paths produce different hash values, so hashes are only comparable
+    between files loaded by the same process.
+    
+    Args:
+        content: The raw contents of the CSV file
+        filename: The name of the CSV file within the zip
+        
+    Returns:
+        Tuple containing:
+        - List of header names
+        - Iterator of (primary key tuple, raw record, hash) tuples in file order
+    """
+    header_end = content.find(b'\n')
+    if header_end == -1:
+        header_end = len(content)
+    header = split_record(content[:header_end].rstrip(b'\r'))
+    body = content[header_end + 1:]
+    
+    # Get the indices of primary key columns in the header
+    pk_indices = [header.index(k) for k in PRIMARY_KEYS.get(filename, [])]
+    
+    if njit is None:
+        return header, iter_indexed_records(body, pk_indices)
+    return header, iter_indexed_records_compiled(body, pk_indices)
 
-def load_csv_from_zip(zip_file: zipfile.ZipFile, filename: str) -> Tuple[List[str], Dict[Tuple, Tuple[List[str], str]]]:
+def load_csv(content: bytes, filename: str) -> Tuple[List[str], Dict[Tuple, Tuple[bytes, int]]]:
     """
-    Load and parse a CSV file from a GTFS zip file.
+    Load and parse the contents of a CSV file from a GTFS zip file.
     
     Args:
-        zip_file: The GTFS zip file to read from
+        content: The raw contents of the CSV file
         filename: The name of the CSV file within the zip
         
     Returns:
         Tuple containing:
         - List of header names
-        - Dictionary mapping primary key tuples to (row data, hash) tuples
+        - Dictionary mapping primary key tuples to (raw record, hash) tuples
     """
-    with zip_file.open(filename) as f:
-        # Read the file content and decode it
-        content = f.read().decode('utf-8')
-        # Split into lines and create a CSV reader
-        reader = csv.reader(content.splitlines())
-        # Get the header
-        header = next(reader)
+    header, records = read_csv(content, filename)
+    data = {pk_values: (record, hash_val) for pk_values, record, hash_val in records}
+    return header, data
+
+def may_be_sorted(content: bytes, filename: str) -> bool:
+    """
+    Cheaply check whether a file in SORTED_FILES is sorted by primary key.
+    
+    Runs scan_sorted over the raw bytes without building any Python objects,
+    so an unsorted file is sent straight to the keyed diff instead of being
+    found out part way through a merge. Without numba, or for files with
+    quoted fields, the order is not checked up front and True is returned;
+    diff_sorted still checks it as it goes.
+    
+    Args:
+        content: The raw contents of the CSV file
+        filename: The name of the CSV file within the zip, a key of SORTED_FILES
         
-        # Get the indices of primary key columns in the header
-        pk_indices = [header.index(k) for k in PRIMARY_KEYS.get(filename, [])]
+    Returns:
+        False if the file is certainly not sorted, True otherwise
+    """
+    if njit is None or b'"' in content:
+        return True
+    header_end = content.find(b'\n')
+    if header_end == -1:
+        return True
+    header = split_record(content[:header_end].rstrip(b'\r'))
+    primary_keys = PRIMARY_KEYS[filename]
+    return scan_sorted(
+        np.frombuffer(content, dtype=np.uint8)[header_end + 1:],
+        np.array([header.index(k) for k in primary_keys], dtype=np.int64),
+        np.array([k in SORTED_FILES[filename] for k in primary_keys], dtype=np.bool_)
+    )
+
+def iter_sorted_records(content: bytes, filename: str) -> Tuple[List[str], Iterator[Tuple[Tuple, Tuple, bytes, int]]]:
+    """
+    Iterate over the records of a CSV file that is sorted by primary key.
+    
+    Args:
+        content: The raw contents of the CSV file
+        filename: The name of the CSV file within the zip, a key of SORTED_FILES
         
-        # Create dictionary mapping primary key tuples to (row data, hash) tuples
-        data = {}
-        for row in reader:
-            if not row:  # Skip empty rows
-                continue
-                
-            # Extract primary key values using the correct indices
-            pk_values = tuple(str(row[i]) for i in pk_indices)
-            data[pk_values] = (row, hash_row(row))
+    Returns:
+        Tuple containing:
+        - List of header names
+        - Iterator of (sort key, primary key tuple, raw record, hash) tuples.
+          It raises UnsortedFileError as soon as a key is not strictly greater
+          than the previous one.
+    """
+    header, records = read_csv(content, filename)
+    numeric = [k in SORTED_FILES[filename] for k in PRIMARY_KEYS[filename]]
     
-    return header, data
+    def sorted_records():
+        previous = None
+        for pk_values, record, hash_val in records:
+            try:
+                sort_key = tuple(int(v) if is_numeric else v for v, is_numeric in zip(pk_values, numeric))
+            except ValueError:
+                raise UnsortedFileError(f"{filename} has a non-numeric sequence value")
+            if previous is not None and sort_key <= previous:
+                raise UnsortedFileError(f"{filename} is not sorted by primary key")
+            previous = sort_key
+            yield sort_key, pk_values, record, hash_val
+    
+    return header, sorted_records()
+
+def write_records(diff_zip: zipfile.ZipFile, name: str, header: List[str], records: List[bytes]) -> None:
+    """Stream a header and raw CSV records into a new file in a zip."""
+    with diff_zip.open(name, 'w', force_zip64=True) as member, \
+         io.BufferedWriter(member, ZIP_WRITE_BUFFER_SIZE) as f:
+        f.write(format_record(header))
+        f.write(b'\r\n')
+        for record in records:
+            f.write(record)
+            f.write(b'\r\n')
+
+def write_rows(diff_zip: zipfile.ZipFile, name: str, header: List[str], rows: List[List[str]]) -> None:
+    """Stream a header and rows of fields as CSV into a new file in a zip."""
+    with diff_zip.open(name, 'w', force_zip64=True) as member, \
+         io.TextIOWrapper(member, encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def read_changed_txt_files(old_zip_path: str, new_zip_path: str) -> Tuple[Dict[str, bytes], Dict[str, bytes]]:
+    """
+    Read the contents of the .txt files that differ between two GTFS zip files.
+    
+    A file whose CRC-32 and size in the central directory are the same in
+    both zips is taken as unchanged and is never decompressed.
+    
+    Returns:
+        Tuple containing the contents of the differing files in the old and
+        new zips, keyed by filename
+    """
+    with zipfile.ZipFile(old_zip_path) as old_zip, zipfile.ZipFile(new_zip_path) as new_zip:
+        old_infos = {info.filename: info for info in old_zip.infolist() if info.filename.endswith('.txt')}
+        new_infos = {info.filename: info for info in new_zip.infolist() if info.filename.endswith('.txt')}
+        unchanged = {
+            filename for filename, info in old_infos.items()
+            if filename in new_infos
+            and (info.CRC, info.file_size) == (new_infos[filename].CRC, new_infos[filename].file_size)
+        }
+        old_files = {filename: old_zip.read(info) for filename, info in old_infos.items() if filename not in unchanged}
+        new_files = {filename: new_zip.read(info) for filename, info in new_infos.items() if filename not in unchanged}
+    return old_files, new_files
+
+def diff_keyed(
+    old_content: bytes,
+    new_content: bytes,
+    filename: str
+) -> Tuple[List[str], List[bytes], List[List[str]]]:
+    """
+    Diff two versions of a GTFS file by loading both into dicts keyed by primary key.
+    
+    Returns:
+        Tuple containing:
+        - Header of the new file
+        - Raw records that were added or modified
+        - Primary key values of records that were deleted
+        Both lists are empty if either file has no records.
+    """
+    old_header, old_data_dict = load_csv(old_content, filename)
+    new_header, new_data_dict = load_csv(new_content, filename)
+    
+    if not old_data_dict or not new_data_dict:
+        return new_header, [], []
+        
+    # Find changed and deleted records
+    changed_rows = []
+    deleted_keys = []
+    
+    # Process new and modified records
+    for pk_tuple, (new_row, new_hash) in new_data_dict.items():
+        if pk_tuple not in old_data_dict:
+            # New record
+            changed_rows.append(new_row)
+        else:
+            old_row, old_hash = old_data_dict[pk_tuple]
+            if old_hash != new_hash:
+                # Changed record
+                changed_rows.append(new_row)
+    
+    # Process deleted records
+    for pk_tuple in old_data_dict:
+        if pk_tuple not in new_data_dict:
+            # Deleted record - the key holds the actual values from the old data
+            deleted_keys.append(list(pk_tuple))
+    
+    return new_header, changed_rows, deleted_keys
+
+def diff_sorted(
+    old_content: bytes,
+    new_content: bytes,
+    filename: str
+) -> Tuple[List[str], List[bytes], List[List[str]]]:
+    """
+    Diff two versions of a GTFS file that are sorted by primary key with a merge.
+    
+    Advances through both files together, so no per-record dict is built.
+    Raises UnsortedFileError if either file turns out not to be sorted.
+    
+    Returns:
+        Same as diff_keyed
+    """
+    _, old_records = iter_sorted_records(old_content, filename)
+    new_header, new_records = iter_sorted_records(new_content, filename)
+    
+    changed_rows = []
+    deleted_keys = []
+    old = next(old_records, None)
+    new = next(new_records, None)
+    has_old_rows = old is not None
+    has_new_rows = new is not None
+    
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            # Deleted record
+            deleted_keys.append(list(old[1]))
+            old = next(old_records, None)
+        elif old is None or new[0] < old[0]:
+            # New record
+            changed_rows.append(new[2])
+            new = next(new_records, None)
+        else:
+            if old[3] != new[3]:
+                # Changed record
+                changed_rows.append(new[2])
+            old = next(old_records, None)
+            new = next(new_records, None)
+    
+    if not has_old_rows or not has_new_rows:
+        return new_header, [], []
+    return new_header, changed_rows, deleted_keys
+
+def diff_one_file(
+    filename: str,
+    old_content: Optional[bytes],
+    new_content: Optional[bytes]
+) -> Tuple[List[str], List[bytes], List[List[str]], Optional[Dict[str, Any]]]:
+    """
+    Diff a single GTFS file between the old and new zip files.
+    
+    Runs in a worker process, so it only takes and returns picklable data.
+    
+    Args:
+        filename: The name of the GTFS file
+        old_content: Contents of the file in the old zip, or None if it is new
+        new_content: Contents of the file in the new zip, or None if it was deleted
+        
+    Returns:
+        Tuple containing:
+        - Header of the new file
+        - Raw records that were added or modified
+        - Primary key values of records that were deleted
+        - Summary entry for the file, or None if it has no changes
+    """
+    if old_content is None:
+        # New file
+        header, data = load_csv(new_content, filename)
+        records = [record for record, _ in data.values()]
+        return header, records, [], {
+            "status": "new_file",
+            "records": len(data)
+        }
+    
+    if new_content is None:
+        # Deleted file
+        _, data = load_csv(old_content, filename)
+        return [], [], [], {
+            "status": "deleted_file",
+            "records": len(data)
+        }
+    
+    # Get primary key field
+    primary_keys = PRIMARY_KEYS.get(filename)
+    if not primary_keys:
+        return [], [], [], None
+    
+    # Compare files, streaming through them when both are sorted by primary key
+    result = None
+    if filename in SORTED_FILES and may_be_sorted(old_content, filename) and may_be_sorted(new_content, filename):
+        try:
+            result = diff_sorted(old_content, new_content, filename)
+        except UnsortedFileError as e:
+            print(f"{e}, falling back to a keyed diff")
+    if result is None:
+        result = diff_keyed(old_content, new_content, filename)
+    new_header, changed_rows, deleted_keys = result
+    
+    if not changed_rows and not deleted_keys:
+        return new_header, [], [], None
+    
+    return new_header, changed_rows, deleted_keys, {
+        "status": "modified",
+        "changed_records": len(changed_rows),
+        "deleted_records": len(deleted_keys)
+    }
 
-def create_diff_zip(old_zip_path: str, new_zip_path: str, output_path: str) -> bool:
+def create_diff_zip(
+    old_zip_path: str,
+    new_zip_path: str,
+    output_path: str,
+    compression: int = zipfile.ZIP_STORED
+) -> bool:
     """
     Create a diff zip file containing only the changes between old and new GTFS data.
     
+    Each GTFS file is diffed in its own worker process; the results are
+    written to the diff zip from the main process as they complete.
+    
     Args:
         old_zip_path: Path to the old GTFS zip file
         new_zip_path: Path to the new GTFS zip file
         output_path: Where to save the diff zip file
+        compression: zipfile compression method for the diff zip
         
     Returns:
         bool: True if there are changes, False if no changes found
@@ -121,117 +710,46 @@ def create_diff_zip(old_zip_path: str, new_zip_path: str, output_path: str) -> b
     print(f"  New: {new_zip_path}")
     start_time = time.time()
     
-    # Load data from both zip files
-    old_data = {}
-    new_data = {}
-    
-    with zipfile.ZipFile(old_zip_path) as old_zip:
-        for filename in old_zip.namelist():
-            if filename.endswith('.txt'):
-                old_data[filename] = load_csv_from_zip(old_zip, filename)
-    
-    with zipfile.ZipFile(new_zip_path) as new_zip:
-        for filename in new_zip.namelist():
-            if filename.endswith('.txt'):
-                new_data[filename] = load_csv_from_zip(new_zip, filename)
+    # Read raw file contents from both zip files, skipping files that have not changed
+    old_files, new_files = read_changed_txt_files(old_zip_path, new_zip_path)
     
     # Track if any changes were found
     has_changes = False
     summary = {}
     
-    # Create diff zip
-    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as diff_zip:
-        # Process each file type
-        for filename in set(old_data.keys()) | set(new_data.keys()):
-            if filename not in old_data:
-                # New file
-                header, data = new_data[filename]
-                output = io.StringIO()
-                writer = csv.writer(output)
-                writer.writerow(header)
-                writer.writerows([row for row, _ in data.values()])
-                diff_zip.writestr(f"{filename}.changes.csv", output.getvalue())
-                has_changes = True
-                summary[filename] = {
-                    "status": "new_file",
-                    "records": len(data)
-                }
-                continue
-                
-            if filename not in new_data:
-                # Deleted file
-                has_changes = True
-                summary[filename] = {
-                    "status": "deleted_file",
-                    "records": len(old_data[filename][1])
-                }
-                continue
-                
-            # Compare files
-            old_header, old_data_dict = old_data[filename]
-            new_header, new_data_dict = new_data[filename]
-            
-            if not old_data_dict or not new_data_dict:
-                continue
-                
-            # Get primary key field
-            primary_keys = PRIMARY_KEYS.get(filename)
-            if not primary_keys:
+    # Create diff zip, with no more worker processes than files to diff
+    filenames = old_files.keys() | new_files.keys()
+    max_workers = max(1, min(len(filenames), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, \
+         zipfile.ZipFile(output_path, 'w', compression) as diff_zip:
+        # Diff each file type in parallel
+        futures = {
+            executor.submit(diff_one_file, filename, old_files.get(filename), new_files.get(filename)): filename
+            for filename in filenames
+        }
+        
+        for future in as_completed(futures):
+            filename = futures[future]
+            header, changed_rows, deleted_keys, file_summary = future.result()
+            if file_summary is None:
                 continue
-                
-            # Find changed and deleted records
-            changed_rows = []
-            deleted_keys = []
-            
-            # Process new and modified records
-            for pk_tuple, (new_row, new_hash) in new_data_dict.items():
-                if pk_tuple not in old_data_dict:
-                    # New record
-                    changed_rows.append(new_row)
-                else:
-                    old_row, old_hash = old_data_dict[pk_tuple]
-                    if old_hash != new_hash:
-                        # Changed record
-                        changed_rows.append(new_row)
-            
-            # Process deleted records
-            for pk_tuple in old_data_dict:
-                if pk_tuple not in new_data_dict:
-                    # Deleted record - use the actual values from the old data
-                    old_row, _ = old_data_dict[pk_tuple]
-                    pk_indices = [old_header.index(k) for k in primary_keys]
-                    deleted_keys.append([old_row[i] for i in pk_indices])
             
-            # Update summary
-            if changed_rows or deleted_keys:
-                has_changes = True
-                summary[filename] = {
-                    "status": "modified",
-                    "changed_records": len(changed_rows),
-                    "deleted_records": len(deleted_keys)
-                }
+            has_changes = True
+            summary[filename] = file_summary
             
             # Write changed records
             if changed_rows:
-                output = io.StringIO()
-                writer = csv.writer(output)
-                writer.writerow(new_header)
-                writer.writerows(changed_rows)
-                diff_zip.writestr(f"{filename}.changes.csv", output.getvalue())
+                write_records(diff_zip, f"{filename}.changes.csv", header, changed_rows)
             
             # Write deleted keys
             if deleted_keys:
-                output = io.StringIO()
-                writer = csv.writer(output)
-                writer.writerow(primary_keys)
-                writer.writerows(deleted_keys)
-                diff_zip.writestr(f"{filename}.deletions.csv", output.getvalue())
+                write_rows(diff_zip, f"{filename}.deletions.csv", PRIMARY_KEYS[filename], deleted_keys)
         
         # Write summary file
-        summary_json = json.dumps({
+        summary_json = orjson.dumps({
             "has_changes": has_changes,
             "files": summary
-        }, indent=2)
+        }, option=orjson.OPT_INDENT_2)
         diff_zip.writestr("summary.json", summary_json)
     
     end_time = time.time()
@@ -243,15 +761,19 @@ def create_diff_zip(old_zip_path: str, new_zip_path: str, output_path: str) -> b
     return has_changes
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3 or len(sys.argv) > 4:
-        print("Usage: python create_gtfs_diff.py previous.zip current.zip [output.zip]")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--compression=")]
+    methods = [arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--compression=")]
+    if len(args) < 2 or len(args) > 3 or len(methods) > 1 or (methods and methods[0] not in COMPRESSION_METHODS):
+        print("Usage: python create_gtfs_diff.py previous.zip current.zip [output.zip] "
+              f"[--compression={'|'.join(COMPRESSION_METHODS)}]")
         sys.exit(1)
 
-    old_path, new_path = sys.argv[1], sys.argv[2]
-    output_path = sys.argv[3] if len(sys.argv) == 4 else "delta.zip"
+    old_path, new_path = args[0], args[1]
+    output_path = args[2] if len(args) == 3 else "delta.zip"
+    compression = COMPRESSION_METHODS[methods[0] if methods else "stored"]
     
     try:
-        has_changes = create_diff_zip(old_path, new_path, output_path)
+        has_changes = create_diff_zip(old_path, new_path, output_path, compression)
         if not has_changes:
             print("No changes found in GTFS data.")
             sys.exit(0)
@@ -1,13 +1,27 @@
 import time
 from collections import Counter
-from typing import Dict, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, FrozenSet, Optional, List, Tuple
 from pathlib import Path
 
 import requests
 from google.transit import gtfs_realtime_pb2
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from gtfs_utils import create_supabase_client
-from load_gtfs_cache import load_cache
+from gtfs_utils import create_supabase_client, split_batch, UPLOAD_BATCH_SIZE, UPLOAD_WORKERS
+from load_gtfs_cache import load_cache_column
+
+# Timeout in seconds for fetching a realtime feed
+FEED_TIMEOUT = 30
+
+# Shared HTTP session so feed requests reuse kept-alive TLS connections
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
 
 # Define all GTFS realtime feeds
 GTFS_FEEDS = [
@@ -33,19 +47,61 @@ def get_cache_dir() -> Path:
     cache_dir.mkdir(exist_ok=True)
     return cache_dir
 
-def get_full_trip_id(trip_ids: List[str], partial_trip_id: str) -> Optional[str]:
-    """Get the full trip ID that contains the partial trip ID."""
+def build_trip_id_index(trip_ids: List[str]) -> Dict[str, str]:
+    """
+    Build an index from realtime (partial) trip IDs to full trip IDs.
+    
+    Realtime feeds identify trips by everything after the first underscore of
+    the static trip ID, e.g. "000600_1..S03R" for "AFA24GEN-1037-Sunday-00_000600_1..S03R".
+    When several trips share a partial ID, the first one wins.
+    """
+    trip_id_index = {}
     for trip_id in trip_ids:
-        if partial_trip_id in trip_id:
-            return trip_id
-    return None
+        trip_id_index.setdefault(trip_id.split('_', 1)[-1], trip_id)
+    return trip_id_index
 
-def get_database_stop_id(stop_ids: Dict[str, str], realtime_stop_id: str) -> Optional[str]:
+def get_full_trip_id(trip_id_index: Dict[str, str], partial_trip_id: str) -> Optional[str]:
+    """Get the full trip ID for a partial (realtime) trip ID."""
+    return trip_id_index.get(partial_trip_id)
+
+def get_database_stop_id(stop_ids: FrozenSet[str], realtime_stop_id: str) -> Optional[str]:
     """Get the database stop ID for a realtime stop ID."""
-    return stop_ids.get(realtime_stop_id)
+    return realtime_stop_id if realtime_stop_id in stop_ids else None
 
-def upload_batch(supabase, table_name: str, data: List[Dict], batch_size: int = 5000):
-    """Upload data in batches to Supabase. If batch upload fails, attempts individual uploads."""
+def upload_one_batch(supabase, table_name: str, batch: List[Dict]) -> Tuple[int, int, bool]:
+    """
+    Upload a single batch to Supabase, falling back to individual uploads if it fails.
+    
+    Returns:
+        Tuple of (records uploaded, individual records that failed, whether the batch upload failed)
+    """
+    try:
+        for part in split_batch(batch):
+            supabase.table(table_name).upsert(part).execute()
+        return len(batch), 0, False
+    except Exception as e:
+        print(f"Error uploading batch to {table_name}: {e}")
+        print("Attempting individual record uploads for this batch...")
+    
+    # Try uploading each record individually
+    uploaded = 0
+    failed_records = 0
+    for record in batch:
+        try:
+            supabase.table(table_name).upsert([record]).execute()
+            uploaded += 1
+        except Exception as individual_error:
+            print(f"Failed to upload individual record: {individual_error}")
+            failed_records += 1
+            continue
+    return uploaded, failed_records, True
+
+def upload_batch(supabase, table_name: str, data: List[Dict], batch_size: int = UPLOAD_BATCH_SIZE):
+    """
+    Upload data in batches to Supabase. If batch upload fails, attempts individual uploads.
+    
+    Batches are uploaded concurrently by UPLOAD_WORKERS threads.
+    """
     if not data:
         return 0
     
@@ -53,26 +109,17 @@ def upload_batch(supabase, table_name: str, data: List[Dict], batch_size: int =
     failed_batches = 0
     failed_records = 0
     
-    for i in range(0, len(data), batch_size):
-        batch = data[i:i + batch_size]
-        try:
-            response = supabase.table(table_name).upsert(batch).execute()
-            total_uploaded += len(batch)
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = [
+            executor.submit(upload_one_batch, supabase, table_name, data[i:i + batch_size])
+            for i in range(0, len(data), batch_size)
+        ]
+        for future in as_completed(futures):
+            uploaded, failed, batch_failed = future.result()
+            total_uploaded += uploaded
+            failed_records += failed
+            failed_batches += batch_failed
             print(f"Uploaded {total_uploaded}/{len(data)} records to {table_name}")
-        except Exception as e:
-            print(f"Error uploading batch to {table_name}: {e}")
-            print("Attempting individual record uploads for this batch...")
-            failed_batches += 1
-            
-            # Try uploading each record individually
-            for record in batch:
-                try:
-                    response = supabase.table(table_name).upsert([record]).execute()
-                    total_uploaded += 1
-                except Exception as individual_error:
-                    print(f"Failed to upload individual record: {individual_error}")
-                    failed_records += 1
-                    continue
     
     if failed_batches > 0:
         print(f"\nUpload Summary for {table_name}:")
@@ -83,16 +130,22 @@ def upload_batch(supabase, table_name: str, data: List[Dict], batch_size: int =
     
     return total_uploaded
 
-def process_feed(feed_url: str, trip_ids: List[str], stop_ids: Dict[str, str], current_timestamp: int) -> Tuple[List[Dict], List[Dict], Dict]:
-    """Process a single GTFS realtime feed and return the updates and statistics."""
-    print(f"\nProcessing feed: {feed_url}")
-    
+def fetch_feed(feed_url: str) -> Optional[gtfs_realtime_pb2.FeedMessage]:
+    """Fetch and parse a single GTFS realtime feed. Returns None if the fetch fails."""
     feed = gtfs_realtime_pb2.FeedMessage()
     try:
-        response = requests.get(feed_url)
+        response = SESSION.get(feed_url, timeout=FEED_TIMEOUT)
         feed.ParseFromString(response.content)
     except Exception as e:
         print(f"Error fetching feed {feed_url}: {e}")
+        return None
+    return feed
+
+def process_feed(feed_url: str, feed: Optional[gtfs_realtime_pb2.FeedMessage], trip_id_index: Dict[str, str], stop_ids: FrozenSet[str], current_timestamp: int) -> Tuple[List[Dict], List[Dict], Dict]:
+    """Process a single fetched GTFS realtime feed and return the updates and statistics."""
+    print(f"\nProcessing feed: {feed_url}")
+    
+    if feed is None:
         return [], [], {
             'total_entities': 0,
             'processed_trips': 0,
@@ -105,56 +158,51 @@ def process_feed(feed_url: str, trip_ids: List[str], stop_ids: Dict[str, str], c
     
     print(f"Number of entities in feed: {len(feed.entity)}")
     
+    # Resolve each trip update to its full trip ID
+    trips = [
+        (entity.trip_update, get_full_trip_id(trip_id_index, entity.trip_update.trip.trip_id))
+        for entity in feed.entity
+        if entity.HasField('trip_update')
+    ]
+    matched_trips = [(trip_update, full_trip_id) for trip_update, full_trip_id in trips if full_trip_id]
+    
+    trip_updates = [{
+        'trip_id': full_trip_id,
+        'route_id': trip_update.trip.route_id,
+        'direction_id': trip_update.trip.direction_id,
+        'timestamp': current_timestamp
+    } for trip_update, full_trip_id in matched_trips]
+    
+    # Flatten the stop time updates of all matched trips
+    stop_time_updates = [
+        (full_trip_id, update)
+        for trip_update, full_trip_id in matched_trips
+        for update in trip_update.stop_time_update
+    ]
+    
+    stop_updates = [{
+        'trip_id': full_trip_id,
+        'stop_id': database_stop_id,
+        'arrival_time': update.arrival.time if update.HasField('arrival') else None,
+        'departure_time': update.departure.time if update.HasField('departure') else None
+    } for full_trip_id, update in stop_time_updates
+        if (database_stop_id := get_database_stop_id(stop_ids, update.stop_id))]
+    
     # Statistics tracking
     stats = {
         'total_entities': len(feed.entity),
-        'processed_trips': 0,
-        'skipped_trips': 0,
-        'skipped_stops': 0,
-        'processed_stops': 0,
-        'skipped_trip_ids': Counter(),
-        'skipped_stop_ids': Counter()
+        'processed_trips': len(matched_trips),
+        'skipped_trips': len(trips) - len(matched_trips),
+        'skipped_stops': len(stop_time_updates) - len(stop_updates),
+        'processed_stops': len(stop_updates),
+        'skipped_trip_ids': Counter(
+            trip_update.trip.trip_id for trip_update, full_trip_id in trips if not full_trip_id
+        ),
+        'skipped_stop_ids': Counter(
+            update.stop_id for _, update in stop_time_updates if update.stop_id not in stop_ids
+        )
     }
     
-    trip_updates = []
-    stop_updates = []
-    
-    for i, entity in enumerate(feed.entity):
-        if entity.HasField('trip_update'):
-            partial_trip_id = entity.trip_update.trip.trip_id
-            full_trip_id = get_full_trip_id(trip_ids, partial_trip_id)
-            
-            if full_trip_id:
-                stats['processed_trips'] += 1
-                trip_update_data = {
-                    'trip_id': full_trip_id,
-                    'route_id': entity.trip_update.trip.route_id,
-                    'direction_id': entity.trip_update.trip.direction_id,
-                    'timestamp': current_timestamp
-                }
-                trip_updates.append(trip_update_data)
-                
-                for update in entity.trip_update.stop_time_update:
-                    database_stop_id = get_database_stop_id(stop_ids, update.stop_id)
-                    if database_stop_id:
-                        stats['processed_stops'] += 1
-                        stop_update = {
-                            'trip_id': full_trip_id,
-                            'stop_id': database_stop_id,
-                            'arrival_time': update.arrival.time if update.HasField('arrival') else None,
-                            'departure_time': update.departure.time if update.HasField('departure') else None
-                        }
-                        stop_updates.append(stop_update)
-                    else:
-                        stats['skipped_stops'] += 1
-                        stats['skipped_stop_ids'][update.stop_id] += 1
-            else:
-                stats['skipped_trips'] += 1
-                stats['skipped_trip_ids'][partial_trip_id] += 1
-            
-            if (i + 1) % 100 == 0:
-                print(f"Processed {i + 1}/{len(feed.entity)} entities")
-    
     return trip_updates, stop_updates, stats
 
 def parse_gtfs_realtime():
@@ -164,11 +212,11 @@ def parse_gtfs_realtime():
     # Get cache directory and load cache data
     cache_dir = get_cache_dir()
     print("Loading cache data...")
-    cache_data = load_cache(cache_dir)
     
-    # Extract trip and stop IDs from cache
-    trip_ids = [trip['id'] for trip in cache_data.get('trips', [])]
-    stop_ids = {stop['id']: stop['id'] for stop in cache_data.get('stops', [])}
+    # Stream just the trip and stop IDs from the cache
+    trip_ids = load_cache_column('trips', 'id', cache_dir)
+    stop_ids = frozenset(load_cache_column('stops', 'id', cache_dir))
+    trip_id_index = build_trip_id_index(trip_ids)
     
     print(f"Loaded {len(trip_ids)} trip IDs and {len(stop_ids)} stop IDs from cache")
     
@@ -187,8 +235,12 @@ def parse_gtfs_realtime():
         'skipped_stop_ids': Counter()
     }
     
-    for feed_url in GTFS_FEEDS:
-        trip_updates, stop_updates, stats = process_feed(feed_url, trip_ids, stop_ids, current_timestamp)
+    # Fetch all feeds concurrently, then process them in order
+    with ThreadPoolExecutor(max_workers=len(GTFS_FEEDS)) as executor:
+        feeds = list(executor.map(fetch_feed, GTFS_FEEDS))
+    
+    for feed_url, feed in zip(GTFS_FEEDS, feeds):
+        trip_updates, stop_updates, stats = process_feed(feed_url, feed, trip_id_index, stop_ids, current_timestamp)
         
         all_trip_updates.extend(trip_updates)
         all_stop_updates.extend(stop_updates)
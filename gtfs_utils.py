@@ -1,9 +1,27 @@
 import os
-import zipfile
+import io
 import csv
+import gc
+import sys
 import time
-from typing import List, Dict, Any, Set
-from supabase import create_client, Client
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from urllib.parse import quote
+from typing import IO, Iterator, List, Dict, Any, Optional, Set, Tuple
+import orjson
+from httpx import Timeout
+from supabase import create_client, Client, ClientOptions
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    # Fall back to the csv module when pyarrow is not installed
+    pa = None
+    pacsv = None
 
 # Supabase configuration from environment variables
 SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -13,7 +31,24 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables must be set")
 
 # Constants
-UPLOAD_BATCH_SIZE = 10000  # Smaller batch size for uploads
+UPLOAD_BATCH_SIZE = int(os.getenv('UPLOAD_BATCH_SIZE', '10000'))  # Rows per upsert request
+MAX_PAYLOAD_BYTES = 5 * 1024 * 1024  # Keep request bodies under PostgREST's limit
+PAYLOAD_SAMPLE_SIZE = 100  # Rows serialized to estimate a batch's payload size
+CSV_BLOCK_SIZE = 1 << 20  # 1 MB blocks for the pyarrow CSV reader
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '8'))  # Concurrent upsert requests
+MAX_DELETE_FILTER_BYTES = 6 * 1024  # URL-encoded filter per delete request; request lines are often capped at 8 KB
+
+# Numeric GTFS columns, converted per column while reading rather than per
+# cell in the parse functions. Empty values are read as None.
+FLOAT_COLUMNS = frozenset({
+    "stop_lat", "stop_lon", "shape_pt_lat", "shape_pt_lon", "shape_dist_traveled"
+})
+INT_COLUMNS = frozenset({
+    "zone_id", "location_type", "route_type", "direction_id", "block_id",
+    "wheelchair_accessible", "bikes_allowed", "stop_sequence", "pickup_type",
+    "drop_off_type", "timepoint", "exception_type", "transfer_type",
+    "min_transfer_time", "shape_pt_sequence"
+})
 
 # Mapping from GTFS file names to table names
 GTFS_TO_TABLE = {
@@ -28,6 +63,9 @@ GTFS_TO_TABLE = {
     "transfers.txt": "transfers"
 }
 
+# Mapping from table names back to GTFS file names
+TABLE_TO_GTFS = {table: gtfs_file for gtfs_file, table in GTFS_TO_TABLE.items()}
+
 # Primary keys for each GTFS file type
 PRIMARY_KEYS = {
     "stops.txt": ["stop_id"],
@@ -62,14 +100,101 @@ COMPOSITE_KEY_TABLES = {
     "transfers": ["from_stop_id", "to_stop_id"]
 }
 
+# Columns that identify a row of each table in the database and the cache.
+# Tables not listed are keyed by "id".
+TABLE_KEY_COLUMNS = {
+    "calendars": ["service_id"],
+    **COMPOSITE_KEY_TABLES
+}
+
+# Parsed rows for the largest tables are kept as namedtuples rather than
+# dictionaries, and only converted with as_records() when uploaded or cached
+StopTime = namedtuple('StopTime', [
+    'trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence',
+    'stop_headsign', 'pickup_type', 'drop_off_type', 'shape_dist_traveled', 'timepoint'
+])
+Shape = namedtuple('Shape', [
+    'shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence', 'shape_dist_traveled'
+])
+
+# Shared thread pool for upserts, bounded to stay under Supabase's connection limit
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+
+@lru_cache(maxsize=None)
 def create_supabase_client() -> Client:
-    """Create and return a Supabase client."""
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    """
+    Create and return a Supabase client.
+    
+    The client is created once per process and shared, so every caller reuses
+    the same pooled HTTP/2 connection that postgrest keeps open.
+    """
+    return create_client(
+        SUPABASE_URL,
+        SUPABASE_KEY,
+        options=ClientOptions(postgrest_client_timeout=Timeout(30.0, connect=5.0))
+    )
 
-def process_batch(supabase: Client, table_name: str, items: List[Dict[str, Any]]) -> None:
+def as_records(items: List[Any]) -> List[Dict[str, Any]]:
+    """Convert namedtuple rows to dictionaries; lists of dictionaries are returned as is."""
+    if items and isinstance(items[0], tuple):
+        fields = items[0]._fields
+        return [dict(zip(fields, item)) for item in items]
+    return items
+
+def split_batch(batch: List[Dict[str, Any]], max_bytes: int = MAX_PAYLOAD_BYTES) -> List[List[Dict[str, Any]]]:
+    """
+    Split a batch so that each part serializes to at most max_bytes of JSON.
+    
+    Args:
+        batch: List of items to upload
+        max_bytes: Maximum serialized size of each part
+        
+    Returns:
+        List of batches, halved until each fits (single items are never split)
+    """
+    if len(batch) <= 1:
+        return [batch]
+    # Estimate the size from a sample, and only serialize the whole batch when it may be close to the limit
+    sample = batch[:PAYLOAD_SAMPLE_SIZE]
+    estimate = len(orjson.dumps(sample)) * len(batch) // len(sample)
+    if estimate <= max_bytes // 2 or len(orjson.dumps(batch)) <= max_bytes:
+        return [batch]
+    middle = len(batch) // 2
+    return split_batch(batch[:middle], max_bytes) + split_batch(batch[middle:], max_bytes)
+
+def upsert_batch(supabase: Client, table_name: str, batch: List[Any]) -> bool:
+    """
+    Upload one batch of items to Supabase.
+    
+    Args:
+        supabase: Supabase client instance
+        table_name: Name of the table to upload to
+        batch: Items to upload
+        
+    Returns:
+        True if the batch was uploaded, False if it failed
+    """
+    try:
+        for part in split_batch(as_records(batch)):
+            supabase.table(table_name).upsert(part).execute()
+    except Exception as e:
+        print(f"Error processing batch for {table_name}: {str(e)}")
+        return False
+    return True
+
+def upsert_item(supabase: Client, table_name: str, item: Any) -> None:
+    """Upload a single item to Supabase, logging any error."""
+    try:
+        supabase.table(table_name).upsert(as_records([item])).execute()
+    except Exception as e:
+        print(f"Error processing item in {table_name}: {str(e)}")
+
+def process_batch(supabase: Client, table_name: str, items: List[Any]) -> None:
     """
     Process a batch of items and upload them to Supabase.
     
+    Batches are uploaded concurrently on the shared upload thread pool.
+    
     Args:
         supabase: Supabase client instance
         table_name: Name of the table to upload to
@@ -79,35 +204,79 @@ def process_batch(supabase: Client, table_name: str, items: List[Dict[str, Any]]
         return
     
     total_items = len(items)
-    start_time = time.time()
+    total_batches = (total_items + UPLOAD_BATCH_SIZE - 1) // UPLOAD_BATCH_SIZE
+    start_time = time.perf_counter()
     
     # Process items in batches
-    for i in range(0, total_items, UPLOAD_BATCH_SIZE):
-        batch = items[i:i + UPLOAD_BATCH_SIZE]
-        batch_num = (i // UPLOAD_BATCH_SIZE) + 1
-        total_batches = (total_items + UPLOAD_BATCH_SIZE - 1) // UPLOAD_BATCH_SIZE
-        
-        batch_start_time = time.time()
-        print(f"Processing batch {batch_num}/{total_batches} for {table_name}...")
+    futures = {
+        _executor.submit(upsert_batch, supabase, table_name, items[i:i + UPLOAD_BATCH_SIZE]): i
+        for i in range(0, total_items, UPLOAD_BATCH_SIZE)
+    }
+    failed_batches = [
+        items[futures[future]:futures[future] + UPLOAD_BATCH_SIZE]
+        for future in as_completed(futures)
+        if not future.result()
+    ]
+    
+    # If batch processing fails, try processing items one by one
+    item_futures = [
+        _executor.submit(upsert_item, supabase, table_name, item)
+        for batch in failed_batches
+        for item in batch
+    ]
+    for future in as_completed(item_futures):
+        future.result()
+    
+    # Report once per call rather than once per batch
+    end_time = time.perf_counter()
+    print(
+        f"Completed processing {table_name}:\n"
+        f"  Total items: {total_items}\n"
+        f"  Batches: {total_batches} ({len(failed_batches)} retried item by item)\n"
+        f"  Total time: {(end_time - start_time):.2f}s"
+    )
+
+def quote_filter_value(value: str) -> str:
+    """Quote a value for use in a PostgREST filter string."""
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+def composite_key_condition(primary_keys: List[str], key: List[str]) -> str:
+    """Build a PostgREST condition of the form and(a.eq."1",b.eq."2") matching one composite key."""
+    return 'and(' + ','.join(
+        f'{pk_name}.eq.{quote_filter_value(value)}'
+        for pk_name, value in zip(primary_keys, key)
+    ) + ')'
+
+def batch_filter_values(values: List[str], max_bytes: int = MAX_DELETE_FILTER_BYTES) -> List[List[str]]:
+    """
+    Group filter values so that each group, comma-joined and URL-encoded, fits in max_bytes.
+    
+    Every character is counted as if percent-encoded, so the estimate never
+    falls short of the encoded request. A value longer than max_bytes still
+    gets a group of its own.
+    
+    Args:
+        values: Filter values, in the order they should be sent
+        max_bytes: Maximum encoded size of each group
         
-        try:
-            supabase.table(table_name).upsert(batch).execute()
-            batch_end_time = time.time()
-            print(f"Uploaded {len(batch)} items in {(batch_end_time - batch_start_time):.2f}s")
-        except Exception as e:
-            print(f"Error processing batch for {table_name}: {str(e)}")
-            # If batch processing fails, try processing items one by one
-            for item in batch:
-                try:
-                    supabase.table(table_name).upsert([item]).execute()
-                except Exception as e:
-                    print(f"Error processing item in {table_name}: {str(e)}")
-                    continue
-    
-    end_time = time.time()
-    print(f"Completed processing {table_name}:")
-    print(f"  Total items: {total_items}")
-    print(f"  Total time: {(end_time - start_time):.2f}s")
+    Returns:
+        List of groups of values
+    """
+    batches = []
+    batch = []
+    size = 0
+    for value in values:
+        value_size = len(quote(value, safe='')) + 9  # Plus the encoded joining comma and any quotes the client adds
+        if batch and size + value_size > max_bytes:
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(value)
+        size += value_size
+    if batch:
+        batches.append(batch)
+    return batches
 
 def delete_records(keys: List[List[str]], table_name: str, supabase: Client) -> None:
     """
@@ -122,7 +291,7 @@ def delete_records(keys: List[List[str]], table_name: str, supabase: Client) ->
         return
     
     # Get the GTFS file name for this table
-    gtfs_file = next((f for f, t in GTFS_TO_TABLE.items() if t == table_name), None)
+    gtfs_file = TABLE_TO_GTFS.get(table_name)
     if not gtfs_file:
         print(f"Error: No GTFS file mapping found for table {table_name}")
         return
@@ -133,46 +302,32 @@ def delete_records(keys: List[List[str]], table_name: str, supabase: Client) ->
         print(f"Error: No primary keys defined for table {table_name}")
         return
     
-    print(f"Processing deletion batch 1/1 for {table_name}...")
-    
-    # Process deletions in smaller batches to avoid URL length limits
-    BATCH_SIZE = 100  # Smaller batch size for deletions
-    total_batches = (len(keys) + BATCH_SIZE - 1) // BATCH_SIZE
+    # Process deletions in batches sized by their encoded filter, to stay under URL length limits
+    is_composite = table_name in COMPOSITE_KEY_TABLES
+    if is_composite:
+        batches = batch_filter_values([composite_key_condition(primary_keys, key) for key in keys])
+    else:
+        db_column = PRIMARY_KEY_TO_DB_COLUMN.get(primary_keys[0])
+        if not db_column:
+            print(f"Error: No database column mapping for {primary_keys[0]}")
+            return
+        batches = batch_filter_values([str(key[0]) for key in keys])
+    total_batches = len(batches)
     total_deleted = 0
     
-    for batch_num in range(total_batches):
-        start_idx = batch_num * BATCH_SIZE
-        end_idx = min((batch_num + 1) * BATCH_SIZE, len(keys))
-        batch_keys = keys[start_idx:end_idx]
-        
+    for batch_num, batch_values in enumerate(batches):
         print(f"Processing deletion batch {batch_num + 1}/{total_batches} for {table_name}...")
         
         try:
-            # For each key in the batch, delete individually
-            for key in batch_keys:
-                try:
-                    query = supabase.table(table_name).delete()
-                    
-                    if table_name in COMPOSITE_KEY_TABLES:
-                        # Handle composite keys
-                        for i, pk_name in enumerate(primary_keys):
-                            query = query.eq(pk_name, key[i])
-                    else:
-                        # Handle single primary key
-                        db_column = PRIMARY_KEY_TO_DB_COLUMN.get(primary_keys[0])
-                        if not db_column:
-                            print(f"Error: No database column mapping for {primary_keys[0]}")
-                            continue
-                        query = query.eq(db_column, key[0])
-                    
-                    result = query.execute()
-                    
-                    if not (hasattr(result, 'error') and result.error):
-                        total_deleted += 1
-                        
-                except Exception as e:
-                    print(f"Error deleting record in {table_name}: {str(e)}")
-                    continue
+            if is_composite:
+                # Handle composite keys with one or=(and(...),...) filter for the whole batch
+                result = supabase.table(table_name).delete().or_(','.join(batch_values)).execute()
+            else:
+                # Handle single primary key with one in.(...) filter for the whole batch
+                result = supabase.table(table_name).delete().in_(db_column, batch_values).execute()
+            
+            if not (hasattr(result, 'error') and result.error):
+                total_deleted += len(batch_values)
             
             print(f"Deleted {total_deleted} records from {table_name} in current batch")
                 
@@ -182,198 +337,277 @@ def delete_records(keys: List[List[str]], table_name: str, supabase: Client) ->
     
     print(f"Total records deleted from {table_name}: {total_deleted}")
 
-def parse_csv_from_zip(zip_file: zipfile.ZipFile, filename: str) -> List[Dict[str, Any]]:
-    """Parse a CSV file from the GTFS zip file."""
+def intern_id(value: Optional[str]) -> Optional[str]:
+    """Intern an optional ID so rows that repeat it share one string."""
+    return sys.intern(value) if value else value
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """Pause the cyclic garbage collector while allocating large numbers of acyclic rows."""
+    enabled = gc.isenabled()
+    gc.disable()
     try:
-        with zip_file.open(filename) as f:
-            reader = csv.DictReader(f.read().decode('utf-8').splitlines())
-            return list(reader)
-    except KeyError:
-        print(f"Warning: {filename} not found in GTFS zip")
-        return []
-
-def parse_agency(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def make_row_type(header: List[str]) -> type:
+    """
+    Create a namedtuple type for the rows of a CSV file.
+    
+    Rows are far smaller as namedtuples than as dictionaries, and the parse
+    functions read them by attribute. Optional columns that are missing from
+    the header are read with getattr(row, name, None).
+    """
+    return namedtuple('Row', header, rename=True)
+
+def arrow_csv_options(header: List[str]) -> Dict[str, Any]:
+    """
+    Build pyarrow CSV reader options for a file with the given header.
+    
+    Columns in FLOAT_COLUMNS and INT_COLUMNS are converted by pyarrow, with
+    empty values read as None; every other column is read as a string.
+    """
+    column_types = {
+        name: pa.float64() if name in FLOAT_COLUMNS else pa.int64() if name in INT_COLUMNS else pa.string()
+        for name in header
+    }
+    return {
+        'read_options': pacsv.ReadOptions(column_names=header, block_size=CSV_BLOCK_SIZE),
+        'convert_options': pacsv.ConvertOptions(column_types=column_types, null_values=[''])
+    }
+
+def convert_numeric_columns(header: List[str], rows: List[List[str]]) -> None:
+    """Convert numeric columns of csv module rows in place, matching the pyarrow reader."""
+    converters = [
+        (i, float if name in FLOAT_COLUMNS else int)
+        for i, name in enumerate(header)
+        if name in FLOAT_COLUMNS or name in INT_COLUMNS
+    ]
+    for row in rows:
+        for i, convert in converters:
+            row[i] = convert(row[i]) if row[i] else None
+
+def iter_csv_batches(f: IO[bytes], batch_size: int = UPLOAD_BATCH_SIZE) -> Iterator[List[Tuple]]:
+    """
+    Stream a CSV file as batches of namedtuple rows.
+    
+    Uses pyarrow's streaming CSV reader when available, falling back to the
+    csv module. Numeric columns are converted while reading (see
+    arrow_csv_options), so the parse functions see the same values either
+    way. Only one batch is held in memory at a time.
+    
+    Args:
+        f: Binary file object containing the CSV data
+        batch_size: Maximum number of rows per batch
+        
+    Yields:
+        Lists of rows, with one field per column
+    """
+    if pacsv is None:
+        reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+        header = next(reader, [])
+        if not header:
+            return
+        Row = make_row_type(header)
+        while batch := [row for row in islice(reader, batch_size) if row]:
+            convert_numeric_columns(header, batch)
+            yield list(map(Row._make, batch))
+        return
+    
+    header = next(csv.reader([f.readline().decode('utf-8')]), [])
+    if not header:
+        return
+    # pyarrow rejects a file with no data after the header, which should just yield nothing
+    if not f.peek(1):
+        return
+    Row = make_row_type(header)
+    reader = pacsv.open_csv(f, **arrow_csv_options(header))
+    for record_batch in reader:
+        for i in range(0, record_batch.num_rows, batch_size):
+            columns = [column.to_pylist() for column in record_batch.slice(i, batch_size).columns]
+            yield list(map(Row._make, zip(*columns)))
+
+def parse_agency(data: List[Tuple]) -> List[Dict[str, Any]]:
     """Parse agency data."""
     return [{
-        'id': row['agency_id'],
-        'agency_name': row['agency_name'],
-        'agency_url': row['agency_url'],
-        'agency_timezone': row['agency_timezone'],
-        'agency_lang': row.get('agency_lang'),
-        'agency_phone': row.get('agency_phone'),
-        'agency_fare_url': row.get('agency_fare_url')
+        'id': row.agency_id,
+        'agency_name': row.agency_name,
+        'agency_url': row.agency_url,
+        'agency_timezone': row.agency_timezone,
+        'agency_lang': getattr(row, 'agency_lang', None),
+        'agency_phone': getattr(row, 'agency_phone', None),
+        'agency_fare_url': getattr(row, 'agency_fare_url', None)
     } for row in data]
 
-def parse_stops(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def parse_stops(data: List[Tuple]) -> List[Dict[str, Any]]:
     """Parse stops data."""
     return [{
-        'id': row['stop_id'],
-        'stop_code': row.get('stop_code'),
-        'stop_name': row['stop_name'],
-        'stop_desc': row.get('stop_desc'),
-        'stop_lat': float(row['stop_lat']) if row['stop_lat'] else 0.0,
-        'stop_lon': float(row['stop_lon']) if row['stop_lon'] else 0.0,
-        'zone_id': int(row['zone_id']) if row.get('zone_id') else None,
-        'stop_url': row.get('stop_url'),
-        'location_type': int(row['location_type']) if row.get('location_type') else None,
-        'parent_station_id': row.get('parent_station')
+        'id': row.stop_id,
+        'stop_code': getattr(row, 'stop_code', None),
+        'stop_name': row.stop_name,
+        'stop_desc': getattr(row, 'stop_desc', None),
+        'stop_lat': row.stop_lat or 0.0,
+        'stop_lon': row.stop_lon or 0.0,
+        'zone_id': getattr(row, 'zone_id', None),
+        'stop_url': getattr(row, 'stop_url', None),
+        'location_type': getattr(row, 'location_type', None),
+        'parent_station_id': getattr(row, 'parent_station', None)
     } for row in data]
 
-def parse_calendar(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def parse_calendar(data: List[Tuple]) -> List[Dict[str, Any]]:
     """Parse calendar data."""
     return [{
-        'service_id': row['service_id'],
-        'monday': row['monday'] == '1',
-        'tuesday': row['tuesday'] == '1',
-        'wednesday': row['wednesday'] == '1',
-        'thursday': row['thursday'] == '1',
-        'friday': row['friday'] == '1',
-        'saturday': row['saturday'] == '1',
-        'sunday': row['sunday'] == '1',
-        'start_date': row['start_date'],
-        'end_date': row['end_date']
+        'service_id': row.service_id,
+        'monday': row.monday == '1',
+        'tuesday': row.tuesday == '1',
+        'wednesday': row.wednesday == '1',
+        'thursday': row.thursday == '1',
+        'friday': row.friday == '1',
+        'saturday': row.saturday == '1',
+        'sunday': row.sunday == '1',
+        'start_date': row.start_date,
+        'end_date': row.end_date
     } for row in data]
 
-def parse_routes(data: List[Dict[str, Any]], agencies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def parse_routes(data: List[Tuple], agency_ids: Set[str]) -> List[Dict[str, Any]]:
     """Parse routes data."""
-    agency_map = {a['id']: a for a in agencies}
     valid_routes = []
     skipped_routes = 0
     
     for row in data:
-        if row['agency_id'] not in agency_map:
+        if row.agency_id not in agency_ids:
             skipped_routes += 1
             continue
         valid_routes.append({
-            'id': row['route_id'],
-            'agency_id': row['agency_id'],
-            'route_short_name': row['route_short_name'],
-            'route_long_name': row['route_long_name'],
-            'route_desc': row.get('route_desc'),
-            'route_type': int(row['route_type']) if row['route_type'] else 0,
-            'route_url': row.get('route_url'),
-            'route_color': row.get('route_color'),
-            'route_text_color': row.get('route_text_color')
+            'id': row.route_id,
+            'agency_id': row.agency_id,
+            'route_short_name': row.route_short_name,
+            'route_long_name': row.route_long_name,
+            'route_desc': getattr(row, 'route_desc', None),
+            'route_type': row.route_type or 0,
+            'route_url': getattr(row, 'route_url', None),
+            'route_color': getattr(row, 'route_color', None),
+            'route_text_color': getattr(row, 'route_text_color', None)
         })
     
     if skipped_routes > 0:
         print(f"Skipped {skipped_routes} routes due to missing agency references")
     return valid_routes
 
-def parse_trips(data: List[Dict[str, Any]], routes: List[Dict[str, Any]], service_ids: Set[str]) -> List[Dict[str, Any]]:
+def parse_trips(data: List[Tuple], route_ids: Set[str], service_ids: Set[str]) -> List[Dict[str, Any]]:
     """Parse trips data."""
-    route_map = {r['id']: r for r in routes}
     valid_trips = []
     skipped_trips = 0
     
     for row in data:
-        if row['route_id'] not in route_map:
+        if row.route_id not in route_ids:
             skipped_trips += 1
             continue
-        if row['service_id'] not in service_ids:
+        if row.service_id not in service_ids:
             skipped_trips += 1
             continue
         valid_trips.append({
-            'id': row['trip_id'],
-            'route_id': row['route_id'],
-            'service_id': row['service_id'],
-            'trip_headsign': row.get('trip_headsign'),
-            'trip_short_name': row.get('trip_short_name'),
-            'direction_id': int(row['direction_id']) if row.get('direction_id') else None,
-            'block_id': int(row['block_id']) if row.get('block_id') else None,
-            'shape_id': row.get('shape_id'),
-            'wheelchair_accessible': int(row['wheelchair_accessible']) if row.get('wheelchair_accessible') else None,
-            'bikes_allowed': int(row['bikes_allowed']) if row.get('bikes_allowed') else None
+            'id': row.trip_id,
+            'route_id': sys.intern(row.route_id),
+            'service_id': sys.intern(row.service_id),
+            'trip_headsign': getattr(row, 'trip_headsign', None),
+            'trip_short_name': getattr(row, 'trip_short_name', None),
+            'direction_id': getattr(row, 'direction_id', None),
+            'block_id': getattr(row, 'block_id', None),
+            'shape_id': intern_id(getattr(row, 'shape_id', None)),
+            'wheelchair_accessible': getattr(row, 'wheelchair_accessible', None),
+            'bikes_allowed': getattr(row, 'bikes_allowed', None)
         })
     
     if skipped_trips > 0:
         print(f"Skipped {skipped_trips} trips due to missing route or service references")
     return valid_trips
 
-def parse_stop_times(data: List[Dict[str, Any]], trips: List[Dict[str, Any]], stops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def parse_stop_times(data: List[Tuple], trip_ids: Set[str], stop_ids: Set[str]) -> List[Tuple]:
     """Parse stop times data."""
-    trip_map = {t['id']: t for t in trips}
-    stop_map = {s['id']: s for s in stops}
     valid_stop_times = []
     skipped_stop_times = 0
     
-    for row in data:
-        if row['trip_id'] not in trip_map:
-            skipped_stop_times += 1
-            continue
-        if row['stop_id'] not in stop_map:
-            skipped_stop_times += 1
-            continue
-        
-        valid_stop_times.append({
-            'trip_id': row['trip_id'],
-            'arrival_time': row['arrival_time'],
-            'departure_time': row['departure_time'],
-            'stop_id': row['stop_id'],
-            'stop_sequence': int(row['stop_sequence']) if row['stop_sequence'] else 0,
-            'stop_headsign': row.get('stop_headsign'),
-            'pickup_type': int(row['pickup_type']) if row.get('pickup_type') else None,
-            'drop_off_type': int(row['drop_off_type']) if row.get('drop_off_type') else None,
-            'shape_dist_traveled': float(row['shape_dist_traveled']) if row.get('shape_dist_traveled') else None,
-            'timepoint': int(row['timepoint']) if row.get('timepoint') else None
-        })
+    # Parsed rows never form reference cycles, so skip cyclic GC passes while building them
+    with gc_paused():
+        for row in data:
+            if row.trip_id not in trip_ids:
+                skipped_stop_times += 1
+                continue
+            if row.stop_id not in stop_ids:
+                skipped_stop_times += 1
+                continue
+            
+            valid_stop_times.append(StopTime(
+                sys.intern(row.trip_id),
+                row.arrival_time,
+                row.departure_time,
+                sys.intern(row.stop_id),
+                row.stop_sequence or 0,
+                getattr(row, 'stop_headsign', None),
+                getattr(row, 'pickup_type', None),
+                getattr(row, 'drop_off_type', None),
+                getattr(row, 'shape_dist_traveled', None),
+                getattr(row, 'timepoint', None)
+            ))
     
     if skipped_stop_times > 0:
         print(f"Skipped {skipped_stop_times} stop times due to missing trip or stop references")
     return valid_stop_times
 
-def parse_calendar_dates(data: List[Dict[str, Any]], calendars: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def parse_calendar_dates(data: List[Tuple], service_ids: Set[str]) -> List[Dict[str, Any]]:
     """Parse calendar dates data."""
-    calendar_map = {c['service_id']: c for c in calendars}
     valid_calendar_dates = []
     skipped_calendar_dates = 0
     
     for row in data:
-        if row['service_id'] not in calendar_map:
+        if row.service_id not in service_ids:
             skipped_calendar_dates += 1
             continue
         
         valid_calendar_dates.append({
-            'service_id': row['service_id'],
-            'date': row['date'],
-            'exception_type': int(row['exception_type']) if row['exception_type'] else 0
+            'service_id': row.service_id,
+            'date': row.date,
+            'exception_type': row.exception_type or 0
         })
     
     if skipped_calendar_dates > 0:
         print(f"Skipped {skipped_calendar_dates} calendar dates due to missing calendar references")
     return valid_calendar_dates
 
-def parse_transfers(data: List[Dict[str, Any]], stops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def parse_transfers(data: List[Tuple], stop_ids: Set[str]) -> List[Dict[str, Any]]:
     """Parse transfers data."""
-    stop_map = {s['id']: s for s in stops}
     valid_transfers = []
     skipped_transfers = 0
     
     for row in data:
-        if row['from_stop_id'] not in stop_map:
+        if row.from_stop_id not in stop_ids:
             skipped_transfers += 1
             continue
-        if row['to_stop_id'] not in stop_map:
+        if row.to_stop_id not in stop_ids:
             skipped_transfers += 1
             continue
         
         valid_transfers.append({
-            'from_stop_id': row['from_stop_id'],
-            'to_stop_id': row['to_stop_id'],
-            'transfer_type': int(row['transfer_type']) if row.get('transfer_type') else 0,
-            'min_transfer_time': int(row['min_transfer_time']) if row.get('min_transfer_time') else None
+            'from_stop_id': row.from_stop_id,
+            'to_stop_id': row.to_stop_id,
+            'transfer_type': getattr(row, 'transfer_type', None) or 0,
+            'min_transfer_time': getattr(row, 'min_transfer_time', None)
         })
     
     if skipped_transfers > 0:
         print(f"Skipped {skipped_transfers} transfers due to missing stop references")
     return valid_transfers
 
-def parse_shapes(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def parse_shapes(data: List[Tuple]) -> List[Tuple]:
     """Parse shapes data."""
-    return [{
-        'shape_id': row['shape_id'],
-        'shape_pt_lat': float(row['shape_pt_lat']),
-        'shape_pt_lon': float(row['shape_pt_lon']),
-        'shape_pt_sequence': int(row['shape_pt_sequence']),
-        'shape_dist_traveled': float(row['shape_dist_traveled']) if row.get('shape_dist_traveled') else None
-    } for row in data] 
\ No newline at end of file
+    with gc_paused():
+        return [Shape(
+            row.shape_id,
+            row.shape_pt_lat,
+            row.shape_pt_lon,
+            row.shape_pt_sequence,
+            getattr(row, 'shape_dist_traveled', None)
+        ) for row in data]
@@ -1,12 +1,24 @@
 import csv
-import hashlib
+import gc
 import zipfile
 import io
+import os
 import sys
 import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from operator import itemgetter
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    # Fall back to comparing rows in Python when pyarrow is not installed
+    pa = None
+    pacsv = None
 
 # Primary keys for each GTFS file type
 PRIMARY_KEYS = {
@@ -20,11 +32,7 @@ PRIMARY_KEYS = {
     "transfers.txt": ["from_stop_id", "to_stop_id"],
 }
 
-def hash_row(row: List[str]) -> str:
-    """Generate an MD5 hash of a row's contents."""
-    return hashlib.md5(','.join(row).encode('utf-8')).hexdigest()
-
-def load_csv_from_zip(zip_file: zipfile.ZipFile, filename: str) -> Tuple[List[str], Dict[Tuple, Tuple[List[str], str]]]:
+def load_csv_from_zip(zip_file: zipfile.ZipFile, filename: str) -> Tuple[List[str], Dict[Any, List[str]]]:
     """
     Load and parse a CSV file from a GTFS zip file.
     
@@ -35,38 +43,131 @@ def load_csv_from_zip(zip_file: zipfile.ZipFile, filename: str) -> Tuple[List[st
     Returns:
         Tuple containing:
         - List of header names
-        - Dictionary mapping primary key tuples to (row data, hash) tuples
+        - Dictionary mapping primary keys to row data. Keys are
+          the bare value for single-column primary keys, tuples otherwise.
     """
-    with zip_file.open(filename) as f:
-        reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8'))
-        header = next(reader)
-        rows = list(reader)
+    # Decode the entry in one call rather than through a per-read TextIOWrapper
+    reader = csv.reader(io.StringIO(zip_file.read(filename).decode('utf-8'), newline=''))
+    header = next(reader)
     
-    pk_indexes = [header.index(k) for k in PRIMARY_KEYS.get(filename, [])]
-    data = {
-        tuple(row[i] for i in pk_indexes): (row, hash_row(row))
-        for row in rows
-    }
+    # itemgetter returns the bare value for single-column primary keys and a tuple otherwise
+    pk_indexes = [header.index(k) for k in PRIMARY_KEYS[filename]]
+    get_key = itemgetter(*pk_indexes)
+    
+    # The index never contains reference cycles, so skip cyclic GC passes while building it
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if len(pk_indexes) == 1:
+            data = {get_key(row): row for row in reader}
+        else:
+            # The first column of a composite key (trip_id, shape_id, ...) repeats
+            # across many rows, so intern it to keep one copy of each ID
+            first = pk_indexes[0]
+            data = {}
+            for row in reader:
+                row[first] = sys.intern(row[first])
+                data[get_key(row)] = row
+    finally:
+        if gc_was_enabled:
+            gc.enable()
     return header, data
 
-def diff_file(name: str, zip_old: zipfile.ZipFile, zip_new: zipfile.ZipFile) -> Tuple[Optional[str], Optional[str], Dict]:
+def load_table_from_zip(zip_file: zipfile.ZipFile, filename: str) -> "pa.Table":
     """
-    Generate diff for a single GTFS file.
+    Load a CSV file from a GTFS zip file as an Arrow table.
     
-    Args:
-        name: Name of the GTFS file
-        zip_old: Old GTFS zip file
-        zip_new: New GTFS zip file
-        
-    Returns:
-        Tuple containing:
-        - Changed records as CSV string
-        - Deleted records as CSV string
-        - Summary statistics dictionary
+    Every column is read as a string so rows compare exactly as written.
     """
-    if name not in PRIMARY_KEYS:
-        return None, None, {}
+    # Read the entry in one call and hand pyarrow a zero-copy buffer over it
+    raw = zip_file.read(filename)
+    header_end = raw.find(b'\n')
+    if header_end == -1:
+        header_end = len(raw)
+    header = next(csv.reader([raw[:header_end].decode('utf-8')]))
+    body = pa.py_buffer(raw)[header_end + 1:]
+    if not body.size:
+        return pa.table({name: pa.array([], pa.string()) for name in header})
+    return pacsv.read_csv(
+        body,
+        read_options=pacsv.ReadOptions(column_names=header),
+        convert_options=pacsv.ConvertOptions(column_types={name: pa.string() for name in header})
+    )
+
+def table_to_csv(table: Optional["pa.Table"]) -> Optional[bytes]:
+    """Write an Arrow table as CSV, or return None if it has no rows."""
+    if table is None or table.num_rows == 0:
+        return None
+    output = pa.BufferOutputStream()
+    pacsv.write_csv(table, output)
+    return output.getvalue().to_pybytes()
+
+def rows_to_csv(header: List[str], rows: List[List[str]]) -> bytes:
+    """Write a header and rows as UTF-8 CSV, encoding as they are written rather than afterwards."""
+    output = io.BytesIO()
+    with io.TextIOWrapper(output, encoding='utf-8', newline='', write_through=True) as text:
+        writer = csv.writer(text)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return output.getvalue()
+
+def diff_file_arrow(name: str, zip_old: zipfile.ZipFile, zip_new: zipfile.ZipFile) -> Tuple[Optional[bytes], Optional[bytes], Dict]:
+    """
+    Generate diff for a single GTFS file using Arrow anti-joins.
+    
+    Changed records are new rows with no identical old row, and deleted
+    records are old primary keys with no matching new row. Both joins run
+    in Arrow's native hash join rather than in Python.
+    """
+    primary_keys = PRIMARY_KEYS[name]
+
+    try:
+        old_table = load_table_from_zip(zip_old, name)
+    except KeyError:
+        old_table = None
+
+    try:
+        new_table = load_table_from_zip(zip_new, name)
+    except KeyError:
+        new_table = None
+
+    total_old = old_table.num_rows if old_table is not None else 0
+    total_new = new_table.num_rows if new_table is not None else 0
+
+    if total_old and total_new and old_table.column_names != new_table.column_names:
+        raise Exception(f"CSV headers for {name} do not match")
+
+    # Find changed and deleted records
+    if not total_old:
+        changed, deleted = new_table, None
+    elif not total_new:
+        changed, deleted = None, old_table.select(primary_keys)
+    else:
+        changed = new_table.join(old_table, keys=new_table.column_names, join_type='left anti')
+        deleted = old_table.select(primary_keys).join(
+            new_table.select(primary_keys), keys=primary_keys, join_type='left anti'
+        )
 
+    num_changed = changed.num_rows if changed is not None else 0
+    num_deleted = deleted.num_rows if deleted is not None else 0
+
+    # Generate summary statistics
+    summary = {
+        "total_old": total_old,
+        "total_new": total_new,
+        "changed": num_changed,
+        "deleted": num_deleted,
+        "added": total_new - (total_old - num_deleted)
+    }
+
+    return table_to_csv(changed), table_to_csv(deleted), summary
+
+def diff_file_csv(name: str, zip_old: zipfile.ZipFile, zip_new: zipfile.ZipFile) -> Tuple[Optional[bytes], Optional[bytes], Dict]:
+    """
+    Generate diff for a single GTFS file by comparing rows in Python.
+    
+    Used when pyarrow is not installed.
+    """
     try:
         old_header, old_data = load_csv_from_zip(zip_old, name)
     except KeyError:
@@ -80,34 +181,21 @@ def diff_file(name: str, zip_old: zipfile.ZipFile, zip_new: zipfile.ZipFile) ->
     if old_data and new_data and old_header != new_header:
         raise Exception(f"CSV headers for {name} do not match")
 
-    # Find changed and deleted records
+    # Find changed and deleted records, comparing rows field by field
     changed_rows = []
-    for key, (row, hash_val) in new_data.items():
-        if key not in old_data or old_data[key][1] != hash_val:
+    for key, row in new_data.items():
+        if old_data.get(key) != row:
             changed_rows.append(row)
 
+    single_key = len(PRIMARY_KEYS[name]) == 1
     deleted_keys = [
-        list(key) for key in old_data
+        [key] if single_key else list(key) for key in old_data
         if key not in new_data
     ]
 
-    # Generate changed records CSV
-    changed_csv = None
-    if changed_rows:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(new_header)
-        writer.writerows(changed_rows)
-        changed_csv = output.getvalue()
-
-    # Generate deleted records CSV
-    deleted_csv = None
-    if deleted_keys:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(PRIMARY_KEYS[name])
-        writer.writerows(deleted_keys)
-        deleted_csv = output.getvalue()
+    # Generate changed and deleted records CSVs
+    changed_csv = rows_to_csv(new_header, changed_rows) if changed_rows else None
+    deleted_csv = rows_to_csv(PRIMARY_KEYS[name], deleted_keys) if deleted_keys else None
 
     # Generate summary statistics
     summary = {
@@ -120,6 +208,32 @@ def diff_file(name: str, zip_old: zipfile.ZipFile, zip_new: zipfile.ZipFile) ->
 
     return changed_csv, deleted_csv, summary
 
+def diff_file(name: str, old_zip_path: str, new_zip_path: str) -> Tuple[Optional[bytes], Optional[bytes], Dict]:
+    """
+    Generate diff for a single GTFS file.
+    
+    Opens its own handles on both zips so it can run in a worker process.
+    
+    Args:
+        name: Name of the GTFS file
+        old_zip_path: Path to the old GTFS zip file
+        new_zip_path: Path to the new GTFS zip file
+        
+    Returns:
+        Tuple containing:
+        - Changed records as CSV
+        - Deleted records as CSV
+        - Summary statistics dictionary
+    """
+    if name not in PRIMARY_KEYS:
+        return None, None, {}
+
+    with zipfile.ZipFile(old_zip_path, 'r') as zip_old, \
+         zipfile.ZipFile(new_zip_path, 'r') as zip_new:
+        if pacsv is not None:
+            return diff_file_arrow(name, zip_old, zip_new)
+        return diff_file_csv(name, zip_old, zip_new)
+
 def validate_gtfs_zip(zip_path: str) -> bool:
     """
     Validate that a zip file contains valid GTFS data.
@@ -159,19 +273,19 @@ def create_diff_zip(old_zip_path: str, new_zip_path: str) -> Path:
     output_zip_path = Path(f"delta_{timestamp}.zip")
     summary = {}
 
+    # Get list of files from both zips
     with zipfile.ZipFile(old_zip_path, 'r') as zip_old, \
-         zipfile.ZipFile(new_zip_path, 'r') as zip_new, \
-         zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-
-        # Get list of files from both zips
+         zipfile.ZipFile(new_zip_path, 'r') as zip_new:
         old_files = {f for f in zip_old.namelist() if f.endswith('.txt')}
         new_files = {f for f in zip_new.namelist() if f.endswith('.txt')}
-        all_files = old_files | new_files
-        
-        for name in sorted(all_files):
-            if name not in PRIMARY_KEYS:
-                continue
-            changed_csv, deleted_csv, file_summary = diff_file(name, zip_old, zip_new)
+    names = sorted(name for name in old_files | new_files if name in PRIMARY_KEYS)
+
+    # Diff each file in its own process; only the parent writes to the output zip
+    max_workers = max(1, min(len(names), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, \
+         zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zip_out:
+        results = executor.map(diff_file, names, repeat(old_zip_path), repeat(new_zip_path))
+        for name, (changed_csv, deleted_csv, file_summary) in zip(names, results):
             summary[name] = file_summary
 
             if changed_csv:
@@ -8,10 +8,10 @@ This script performs a complete reset of the GTFS data:
 4. Processes realtime updates
 
 Usage:
-    python hard_reset.py
+    python hard_reset.py [gtfs.zip]
 
 The script will:
-1. Download the latest GTFS data
+1. Download the latest GTFS data, unless a GTFS zip file is given
 2. Process all GTFS files
 3. Update the cache with the new data
 4. Start processing realtime updates
@@ -19,24 +19,29 @@ The script will:
 Dependencies:
 - requests: For downloading GTFS data
 - supabase: For database operations
+- pyarrow (optional): For fast CSV parsing
 - gtfs_utils: For shared GTFS processing functions
 """
 
-import csv
-import io
 import sys
 import time
 import requests
 import tempfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 import shutil
 
+from supabase import Client
+
 from gtfs_utils import (
     create_supabase_client,
     process_batch,
+    iter_csv_batches,
     GTFS_TO_TABLE,
+    UPLOAD_BATCH_SIZE,
+    UPLOAD_WORKERS,
     parse_agency,
     parse_stops,
     parse_routes,
@@ -49,6 +54,12 @@ from gtfs_utils import (
 from save_gtfs_cache import save_cache
 from gtfs_realtime_parser import parse_gtfs_realtime
 
+# 1 MB download chunks; 8 KB reads left the loop bound by Python overhead rather than the network
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Minimum seconds between download progress updates
+PROGRESS_INTERVAL = 0.1
+
 def download_gtfs_zip(url: str, output_path: str) -> None:
     """
     Download a GTFS zip file from a URL.
@@ -68,15 +79,19 @@ def download_gtfs_zip(url: str, output_path: str) -> None:
         response.raise_for_status()
         
         total_size = int(response.headers.get('content-length', 0))
-        block_size = 8192  # 8 KB chunks
+        block_size = DOWNLOAD_CHUNK_SIZE
         downloaded = 0
+        last_progress = 0.0
         
         with open(output_path, 'wb') as f:
             for data in response.iter_content(block_size):
                 downloaded += len(data)
                 f.write(data)
                 
-                if total_size > 0:
+                # Throttle progress updates so printing never competes with the download
+                now = time.monotonic()
+                if total_size > 0 and (now - last_progress >= PROGRESS_INTERVAL or downloaded >= total_size):
+                    last_progress = now
                     percent = (downloaded / total_size) * 100
                     print(f"\rDownload progress: {percent:.1f}%", end='')
         
@@ -86,23 +101,49 @@ def download_gtfs_zip(url: str, output_path: str) -> None:
         print(f"Error downloading GTFS data: {str(e)}")
         raise
 
-def parse_csv_from_zip(zip_file: zipfile.ZipFile, filename: str) -> List[Dict]:
+def process_gtfs_file(
+    zip_file: zipfile.ZipFile,
+    filename: str,
+    parse_func: Callable,
+    supabase: Client,
+    **params: Any
+) -> Optional[List[Any]]:
     """
-    Parse a CSV file from a GTFS zip file.
+    Stream a GTFS file through its parse function and upload it as it is read.
+    
+    Each chunk of raw CSV rows is parsed while the previous chunk uploads, so
+    reading and uploading overlap and at most two chunks are held at a time.
     
     Args:
         zip_file: The GTFS zip file to read from
         filename: The name of the CSV file within the zip
+        parse_func: Function to parse records from the file
+        supabase: Supabase client instance
+        **params: Extra arguments for the parse function
         
     Returns:
-        List of dictionaries containing the CSV data
+        All parsed records for caching, or None if the file is not in the zip
     """
+    parsed = []
+    upload = None
     try:
-        with zip_file.open(filename) as f:
-            reader = csv.DictReader(io.TextIOWrapper(f, encoding='utf-8'))
-            return list(reader)
+        with zip_file.open(filename) as f, ThreadPoolExecutor(max_workers=1) as uploader:
+            # Read enough rows per chunk to keep every upload worker busy
+            for data in iter_csv_batches(f, UPLOAD_BATCH_SIZE * UPLOAD_WORKERS):
+                records = parse_func(data, **params)
+                # Upload this chunk while the next one is read and parsed, with at most one chunk in flight
+                if upload is not None:
+                    upload.result()
+                upload = uploader.submit(process_batch, supabase, GTFS_TO_TABLE[filename], records)
+                parsed.extend(records)
+            
+            # Finish uploading before dependent files are processed
+            if upload is not None:
+                upload.result()
     except KeyError:
-        return []
+        print(f"Warning: {filename} not found in GTFS zip")
+        return None
+    return parsed
 
 def process_gtfs_zip(zip_path: str) -> Dict[str, List[Dict]]:
     """
@@ -119,55 +160,39 @@ def process_gtfs_zip(zip_path: str) -> Dict[str, List[Dict]]:
     
     with zipfile.ZipFile(zip_path) as zip_file:
         # Process independent entities first
-        agency_data = parse_csv_from_zip(zip_file, 'agency.txt')
-        if agency_data:
-            agencies = parse_agency(agency_data)
-            process_batch(supabase, GTFS_TO_TABLE['agency.txt'], agencies)
+        agencies = process_gtfs_file(zip_file, 'agency.txt', parse_agency, supabase)
+        if agencies is not None:
             processed_data['agencies'] = agencies
         
-        stop_data = parse_csv_from_zip(zip_file, 'stops.txt')
-        if stop_data:
-            stops = parse_stops(stop_data)
-            process_batch(supabase, GTFS_TO_TABLE['stops.txt'], stops)
+        stops = process_gtfs_file(zip_file, 'stops.txt', parse_stops, supabase)
+        if stops is not None:
             processed_data['stops'] = stops
         
         # Process routes (depends on agencies)
-        route_data = parse_csv_from_zip(zip_file, 'routes.txt')
-        if route_data:
-            routes = parse_routes(route_data, agencies if agency_data else [])
-            process_batch(supabase, GTFS_TO_TABLE['routes.txt'], routes)
+        routes = process_gtfs_file(zip_file, 'routes.txt', parse_routes, supabase, agency_ids={a['id'] for a in agencies or []})
+        if routes is not None:
             processed_data['routes'] = routes
         
         # Process dependent entities
-        calendar_data = parse_csv_from_zip(zip_file, 'calendar.txt')
-        if calendar_data:
-            calendars = parse_calendar(calendar_data)
-            process_batch(supabase, GTFS_TO_TABLE['calendar.txt'], calendars)
+        calendars = process_gtfs_file(zip_file, 'calendar.txt', parse_calendar, supabase)
+        if calendars is not None:
             processed_data['calendars'] = calendars
         
-        calendar_dates_data = parse_csv_from_zip(zip_file, 'calendar_dates.txt')
-        if calendar_dates_data:
-            calendar_dates = parse_calendar_dates(calendar_dates_data, calendars if calendar_data else [])
-            process_batch(supabase, GTFS_TO_TABLE['calendar_dates.txt'], calendar_dates)
+        service_ids = {c['service_id'] for c in calendars or []}
+        calendar_dates = process_gtfs_file(zip_file, 'calendar_dates.txt', parse_calendar_dates, supabase, service_ids=service_ids)
+        if calendar_dates is not None:
             processed_data['calendar_dates'] = calendar_dates
         
-        trip_data = parse_csv_from_zip(zip_file, 'trips.txt')
-        if trip_data:
-            service_ids = {c['service_id'] for c in calendars} if calendar_data else set()
-            trips = parse_trips(trip_data, routes if route_data else [], service_ids)
-            process_batch(supabase, GTFS_TO_TABLE['trips.txt'], trips)
+        trips = process_gtfs_file(zip_file, 'trips.txt', parse_trips, supabase, route_ids={r['id'] for r in routes or []}, service_ids=service_ids)
+        if trips is not None:
             processed_data['trips'] = trips
         
-        stop_times_data = parse_csv_from_zip(zip_file, 'stop_times.txt')
-        if stop_times_data:
-            stop_times = parse_stop_times(stop_times_data, trips if trip_data else [], stops if stop_data else [])
-            process_batch(supabase, GTFS_TO_TABLE['stop_times.txt'], stop_times)
+        stop_times = process_gtfs_file(zip_file, 'stop_times.txt', parse_stop_times, supabase, trip_ids={t['id'] for t in trips or []}, stop_ids={s['id'] for s in stops or []})
+        if stop_times is not None:
             processed_data['stop_times'] = stop_times
         
-        shape_data = parse_csv_from_zip(zip_file, 'shapes.txt')
-        if shape_data:
-            shapes = parse_shapes(shape_data)
-            process_batch(supabase, GTFS_TO_TABLE['shapes.txt'], shapes)
+        shapes = process_gtfs_file(zip_file, 'shapes.txt', parse_shapes, supabase)
+        if shapes is not None:
             processed_data['shapes'] = shapes
     
     return processed_data
@@ -184,7 +209,64 @@ def ensure_cache_dir() -> Path:
     cache_dir.mkdir(exist_ok=True)
     return cache_dir
 
-def main():
+def reset_from_zip(gtfs_zip_path: Path) -> None:
+    """
+    Reset the database and cache from a downloaded GTFS zip file.
+    
+    Args:
+        gtfs_zip_path: Path to the GTFS zip file
+    """
+    # Save downloaded GTFS data to cache
+    print("\nSaving GTFS data to cache...")
+    cache_dir = ensure_cache_dir()
+    cache_zip_path = cache_dir / "gtfs-data-latest.zip"
+    
+    # Copy the downloaded file to cache
+    shutil.copy2(gtfs_zip_path, cache_zip_path)
+    print(f"GTFS data saved to cache: {cache_zip_path}")
+    
+    # Step 1: Flash GTFS data to database
+    print("\nStep 1: Flashing GTFS data to database...")
+    try:
+        processed_data = process_gtfs_zip(str(gtfs_zip_path))
+    except Exception as e:
+        print(f"Failed to flash GTFS data: {str(e)}")
+        sys.exit(1)
+    
+    # Step 2: Save cache
+    print("\nStep 2: Saving cache...")
+    try:
+        save_cache(processed_data)
+        print("Cache saved successfully")
+    except Exception as e:
+        print(f"Failed to save cache: {str(e)}")
+        sys.exit(1)
+    
+    # Step 3: Process realtime updates
+    print("\nStep 3: Processing realtime updates...")
+    try:
+        parse_gtfs_realtime()
+    except Exception as e:
+        print(f"Failed to process realtime updates: {str(e)}")
+        sys.exit(1)
+    
+    print("\n=== GTFS Update Process Completed Successfully ===")
+
+def main(gtfs_zip_path: Optional[str] = None):
+    """
+    Run a hard reset, downloading the latest GTFS data unless a zip file is given.
+    
+    Args:
+        gtfs_zip_path: Optional path to an already downloaded GTFS zip file
+    """
+    if gtfs_zip_path is not None:
+        try:
+            reset_from_zip(Path(gtfs_zip_path))
+        except Exception as e:
+            print(f"Error during GTFS update: {str(e)}")
+            sys.exit(1)
+        return
+    
     # GTFS data URL
     gtfs_url = "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_supplemented.zip"
     
@@ -196,46 +278,11 @@ def main():
         try:
             # Download latest GTFS data
             download_gtfs_zip(gtfs_url, str(gtfs_zip_path))
-            
-            # Save downloaded GTFS data to cache
-            print("\nSaving GTFS data to cache...")
-            cache_dir = ensure_cache_dir()
-            cache_zip_path = cache_dir / "gtfs-data-latest.zip"
-            
-            # Copy the downloaded file to cache
-            shutil.copy2(gtfs_zip_path, cache_zip_path)
-            print(f"GTFS data saved to cache: {cache_zip_path}")
-            
-            # Step 1: Flash GTFS data to database
-            print("\nStep 1: Flashing GTFS data to database...")
-            try:
-                processed_data = process_gtfs_zip(str(gtfs_zip_path))
-            except Exception as e:
-                print(f"Failed to flash GTFS data: {str(e)}")
-                sys.exit(1)
-            
-            # Step 2: Save cache
-            print("\nStep 2: Saving cache...")
-            try:
-                save_cache(processed_data)
-                print("Cache saved successfully")
-            except Exception as e:
-                print(f"Failed to save cache: {str(e)}")
-                sys.exit(1)
-            
-            # Step 3: Process realtime updates
-            print("\nStep 3: Processing realtime updates...")
-            try:
-                parse_gtfs_realtime()
-            except Exception as e:
-                print(f"Failed to process realtime updates: {str(e)}")
-                sys.exit(1)
-            
-            print("\n=== GTFS Update Process Completed Successfully ===")
+            reset_from_zip(gtfs_zip_path)
             
         except Exception as e:
             print(f"Error during GTFS update: {str(e)}")
             sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main(sys.argv[1] if len(sys.argv) > 1 else None) 
\ No newline at end of file
@@ -8,15 +8,163 @@ Usage:
     python load_gtfs_cache.py [table1 table2 ...]
 
 If no tables are specified, it will load all available cache files.
-Each cache file should be a JSON file containing a timestamp and data array.
+Each cache file is gzipped JSON Lines: a header line with the timestamp,
+then one record per line. Caches written before that format, a single JSON
+file containing a timestamp and data array, are still read; their records
+are streamed from the data array with ijson. Either way iter_cache can be
+used to read a table without holding all of it in memory.
 
 Example:
     python load_gtfs_cache.py agencies stops routes
 """
 
-import json
+import gzip
 import os
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
+
+import ijson
+import orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.json as pajson
+except ImportError:
+    # Fall back to streaming records with orjson when pyarrow is not installed
+    pa = None
+    pajson = None
+
+# Cache file suffixes, current format first
+CACHE_SUFFIX = ".jsonl.gz"
+LEGACY_CACHE_SUFFIX = ".json"
+
+# Errors raised when reading a corrupt or truncated cache file
+CACHE_READ_ERRORS = (ijson.JSONError, ValueError, EOFError, gzip.BadGzipFile)
+
+def find_cache_file(table_name: str, cache_dir: str = "cache") -> Optional[str]:
+    """Return the path of a table's cache file, preferring the current format, or None if there is none."""
+    for suffix in (CACHE_SUFFIX, LEGACY_CACHE_SUFFIX):
+        cache_file = os.path.join(cache_dir, f"{table_name}{suffix}")
+        if os.path.exists(cache_file):
+            return cache_file
+    return None
+
+def iter_cache(table_name: str, cache_dir: str = "cache") -> Iterator[Dict[str, Any]]:
+    """
+    Stream the records of one table from its cache file.
+    
+    Records are parsed one at a time, so callers that only need a few
+    fields never hold the whole table in memory.
+    
+    Args:
+        table_name: Name of the table to read
+        cache_dir: Directory containing cache files
+    
+    Yields:
+        Cached records, one dictionary per row
+    
+    Raises:
+        FileNotFoundError: If there is no cache file for the table
+        ValueError, ijson.JSONError, EOFError: If the cache file is corrupt
+    """
+    cache_file = find_cache_file(table_name, cache_dir)
+    if cache_file is None:
+        raise FileNotFoundError(f"No cache file found for {table_name}")
+    
+    if cache_file.endswith(CACHE_SUFFIX):
+        with gzip.open(cache_file, 'rb') as f:
+            next(f, None)  # Skip the timestamp header line
+            for line in f:
+                yield orjson.loads(line)
+        return
+    
+    with open(cache_file, 'rb') as f:
+        # use_float keeps numbers as floats rather than ijson's default Decimal
+        yield from ijson.items(f, 'data.item', use_float=True)
+
+def read_cache_column_arrow(cache_file: str, field: str) -> Optional[List[Any]]:
+    """
+    Read one field of a JSON Lines cache file with Arrow's JSON reader.
+    
+    Only the requested field is converted, and parsing runs in Arrow's
+    multi-threaded reader rather than record by record in Python. The
+    field's type is taken from the first record.
+    
+    Returns:
+        The field's values in cache order, or None if the file cannot be
+        read this way and should be streamed instead
+    
+    Raises:
+        KeyError: If the first record has no such field
+    """
+    arrow_types = {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}
+    with gzip.open(cache_file, 'rb') as f:
+        next(f, None)  # Skip the timestamp header line
+        first = f.readline()
+    if not first:
+        return []
+    arrow_type = arrow_types.get(type(orjson.loads(first)[field]))
+    if arrow_type is None:
+        return None
+    
+    # Arrow decompresses the file itself; the header line reads as a row without the field
+    parse_options = pajson.ParseOptions(
+        explicit_schema=pa.schema([(field, arrow_type)]),
+        unexpected_field_behavior='ignore'
+    )
+    try:
+        table = pajson.read_json(cache_file, parse_options=parse_options)
+    except (pa.ArrowInvalid, OSError):
+        return None
+    
+    values = table.column(field)[1:]
+    if values.null_count:
+        return values.to_pylist()
+    # Converting through numpy is far faster than to_pylist when there are no nulls to keep
+    return values.to_numpy(zero_copy_only=False).tolist()
+
+def load_cache_column(table_name: str, field: str = "id", cache_dir: str = "cache") -> List[Any]:
+    """
+    Load a single field of every cached record of a table.
+    
+    Records are streamed and only the field's values are kept, which is all
+    that callers collecting IDs need. When pyarrow is installed the field is
+    read with Arrow's JSON reader instead.
+    
+    Args:
+        table_name: Name of the table to read
+        field: Name of the field to collect
+        cache_dir: Directory containing cache files
+    
+    Returns:
+        The field's values in cache order, or an empty list if the cache file
+        is missing or invalid
+    """
+    try:
+        values = None
+        cache_file = find_cache_file(table_name, cache_dir)
+        if pajson is not None and cache_file is not None and cache_file.endswith(CACHE_SUFFIX):
+            values = read_cache_column_arrow(cache_file, field)
+        if values is None:
+            values = [record[field] for record in iter_cache(table_name, cache_dir)]
+    except FileNotFoundError:
+        print(f"No cache file found for {table_name}")
+        return []
+    except (KeyError, *CACHE_READ_ERRORS) as e:
+        print(f"Error loading cache for {table_name}: {e}")
+        return []
+    print(f"Loaded {len(values)} {field} values from {table_name} cache")
+    return values
+
+def list_cached_tables(cache_dir: str = "cache") -> List[str]:
+    """Return the names of all tables with a cache file, in sorted order."""
+    with os.scandir(cache_dir) as entries:
+        names = sorted(entry.name for entry in entries if entry.is_file())
+    return list(dict.fromkeys(
+        name[:-len(suffix)]
+        for name in names
+        for suffix in (CACHE_SUFFIX, LEGACY_CACHE_SUFFIX)
+        if name.endswith(suffix)
+    ))
 
 def load_cache(cache_dir: str = "cache", tables: Optional[List[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
     """
@@ -33,20 +181,16 @@ def load_cache(cache_dir: str = "cache", tables: Optional[List[str]] = None) ->
     
     # If no specific tables requested, try to load all available cache files
     if tables is None:
-        tables = [f.replace('.json', '') for f in os.listdir(cache_dir) if f.endswith('.json')]
+        tables = list_cached_tables(cache_dir)
     
     for table_name in tables:
-        cache_file = os.path.join(cache_dir, f"{table_name}.json")
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                    cached_data[table_name] = cache_data['data']
-                print(f"Loaded {len(cached_data[table_name])} records from {table_name} cache")
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"Error loading cache for {table_name}: {e}")
-        else:
+        try:
+            cached_data[table_name] = list(iter_cache(table_name, cache_dir))
+            print(f"Loaded {len(cached_data[table_name])} records from {table_name} cache")
+        except FileNotFoundError:
             print(f"No cache file found for {table_name}")
+        except CACHE_READ_ERRORS as e:
+            print(f"Error loading cache for {table_name}: {e}")
     
     return cached_data
 
@@ -56,15 +200,25 @@ def main():
     # Get tables to load from command line arguments
     tables = sys.argv[1:] if len(sys.argv) > 1 else None
     
-    # Load from cache
+    if tables is None:
+        tables = list_cached_tables()
+    
+    # Stream each table to count its records rather than holding every row in memory
     print("Loading from cache...")
-    loaded_data = load_cache(tables=tables)
-    print(f"Loaded {len(loaded_data)} tables from cache")
+    counts = {}
+    for table_name in tables:
+        try:
+            counts[table_name] = sum(1 for _ in iter_cache(table_name))
+        except FileNotFoundError:
+            print(f"No cache file found for {table_name}")
+        except CACHE_READ_ERRORS as e:
+            print(f"Error loading cache for {table_name}: {e}")
+    print(f"Loaded {len(counts)} tables from cache")
     
     # Print summary of loaded data
     print("\nSummary of loaded data:")
-    for table_name, records in loaded_data.items():
-        print(f"{table_name}: {len(records)} records")
+    for table_name, count in counts.items():
+        print(f"{table_name}: {count} records")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
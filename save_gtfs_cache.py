@@ -2,40 +2,88 @@
 GTFS Cache Saver
 
 This script loads GTFS data from the database and saves it to cache files.
-Each table's data is saved in a separate JSON file with a timestamp.
+Each table's data is saved in a separate gzipped JSON Lines file: a header
+line with the timestamp, then one record per line.
 
 Usage:
     python save_gtfs_cache.py
 
 The script will:
 1. Load data from each GTFS table in the database
-2. Save the data to JSON files in the cache directory
+2. Save the data to .jsonl.gz files in the cache directory
 3. Include a timestamp with each cache file
 """
 
-import json
+import gzip
 import os
-from datetime import datetime
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice, repeat
+from typing import Dict, Iterable, List, Any, Optional
 
-from gtfs_utils import create_supabase_client, GTFS_TO_TABLE
+import orjson
 
+from gtfs_utils import create_supabase_client, as_records, GTFS_TO_TABLE, TABLE_KEY_COLUMNS, UPLOAD_WORKERS
+from load_gtfs_cache import CACHE_SUFFIX, LEGACY_CACHE_SUFFIX
 
-def load_table_data(supabase, table_name: str, select_fields: str = '*') -> List[Dict[str, Any]]:
-    """Load all records from a table in batches."""
+# gzip level for cache files; most of the size reduction at a fraction of level 9's CPU
+CACHE_COMPRESSLEVEL = 3
+
+# Records serialized per write to a cache file
+CACHE_WRITE_BATCH_SIZE = 10000
+
+# Rows per select request; PostgREST returns at most 1000 rows per request by default
+FETCH_BATCH_SIZE = 1000
+
+# Concurrent select requests per table, bounded like uploads by Supabase's connection limit
+FETCH_WORKERS = UPLOAD_WORKERS
+
+def fetch_range(supabase, table_name: str, select_fields: str, start: int, end: int) -> List[Dict[str, Any]]:
+    """Fetch rows start to end (inclusive) of a table, in primary key order."""
+    query = supabase.table(table_name).select(select_fields)
+    for column in TABLE_KEY_COLUMNS.get(table_name, ["id"]):
+        query = query.order(column)
+    return query.range(start, end).execute().data
+
+def load_table_data(
+    supabase,
+    table_name: str,
+    select_fields: str = '*',
+    executor: Optional[ThreadPoolExecutor] = None
+) -> List[Dict[str, Any]]:
+    """
+    Load all records from a table in batches.
+    
+    Batches are fetched concurrently, and every request orders by the primary
+    key so the ranges page through one consistent ordering of the table.
+    Pass a shared executor to bound the requests of several tables loading at
+    once; otherwise a pool of FETCH_WORKERS threads is used for this table.
+    """
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            return load_table_data(supabase, table_name, select_fields, executor)
+    
     records = []
-    # Get total count first
-    count_response = supabase.table(table_name).select(select_fields, count='exact').execute()
+    # Get total count first, without fetching any rows
+    count_response = supabase.table(table_name).select(select_fields, count='exact', head=True).execute()
     total_count = count_response.count
     
     # Fetch all records in batches
-    batch_size = 1000
-    for start in range(0, total_count, batch_size):
-        end = min(start + batch_size, total_count) - 1  # -1 because range is inclusive
-        response = supabase.table(table_name).select(select_fields).range(start, end).execute()
-        if response.data:
-            records.extend(response.data)
-            print(f"Loaded {table_name} {start} to {end} of {total_count} (batch size: {len(response.data)})")
+    starts = range(0, total_count, FETCH_BATCH_SIZE)
+    futures = [
+        executor.submit(
+            fetch_range, supabase, table_name, select_fields,
+            start, min(start + FETCH_BATCH_SIZE, total_count) - 1  # -1 because range is inclusive
+        )
+        for start in starts
+    ]
+    # Collect in order so records keep the table's ordering
+    for start, future in zip(starts, futures):
+        end = min(start + FETCH_BATCH_SIZE, total_count) - 1
+        data = future.result()
+        if data:
+            records.extend(data)
+            print(f"Loaded {table_name} {start} to {end} of {total_count} (batch size: {len(data)})")
         else:
             print(f"Warning: No data received for {table_name} batch {start} to {end}")
     
@@ -45,30 +93,78 @@ def load_table_data(supabase, table_name: str, select_fields: str = '*') -> List
     
     return records
 
-def save_cache(data: Dict[str, List[Dict[str, Any]]], cache_dir: str = "cache"):
-    """Save data to cache files."""
+def write_cache_file(cache_file: str, records: Iterable[Dict[str, Any]], timestamp: Optional[str] = None) -> None:
+    """
+    Write a cache file: a timestamp header line, then one record per line.
+    
+    The file is written under a temporary name and renamed into place, so
+    readers never see a partly written cache and an interrupted write leaves
+    the previous file intact. The timestamp defaults to the current UTC time.
+    """
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc).isoformat()
+    temp_file = f"{cache_file}.tmp"
+    try:
+        with gzip.open(temp_file, "wb", compresslevel=CACHE_COMPRESSLEVEL) as f:
+            f.write(orjson.dumps({"timestamp": timestamp}, option=orjson.OPT_APPEND_NEWLINE))
+            # Hand the compressor one large block per batch rather than one small write per record
+            records = iter(records)
+            while batch := list(islice(records, CACHE_WRITE_BATCH_SIZE)):
+                f.write(b"".join([orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in batch]))
+        os.replace(temp_file, cache_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def remove_legacy_cache(table_name: str, cache_dir: str = "cache") -> None:
+    """Remove a table's cache file left over from the single-JSON format, if any."""
+    legacy_file = os.path.join(cache_dir, f"{table_name}{LEGACY_CACHE_SUFFIX}")
+    if os.path.exists(legacy_file):
+        os.remove(legacy_file)
+
+def save_table_cache(table_name: str, records: List[Any], cache_dir: str = "cache", timestamp: Optional[str] = None) -> None:
+    """Save one table's records to its cache file."""
+    write_cache_file(os.path.join(cache_dir, f"{table_name}{CACHE_SUFFIX}"), as_records(records), timestamp)
+    remove_legacy_cache(table_name, cache_dir)
+
+def save_cache(data: Dict[str, List[Any]], cache_dir: str = "cache"):
+    """
+    Save data to cache files.
+    
+    Tables are independent, so each one is serialized and compressed in its
+    own thread. zlib releases the GIL while compressing, and threads share
+    the records rather than pickling them into worker processes.
+    """
     # Create cache directory if it doesn't exist
     os.makedirs(cache_dir, exist_ok=True)
     
+    # Every table in one save shares the same timestamp
+    timestamp = datetime.now(timezone.utc).isoformat()
+    
     # Save each table's data
-    for table_name, records in data.items():
-        with open(os.path.join(cache_dir, f"{table_name}.json"), "w") as f:
-            json.dump({
-                "timestamp": datetime.utcnow().isoformat(),
-                "data": records
-            }, f)
+    max_workers = max(1, min(len(data), os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(save_table_cache, data.keys(), data.values(), repeat(cache_dir), repeat(timestamp)))
 
 def main():
     # Initialize Supabase client
     supabase = create_supabase_client()
     
-    # Load data for each table
-    cached_data = {}
-    for table_name in GTFS_TO_TABLE.values():
-        print(f"\nLoading {table_name}...")
-        records = load_table_data(supabase, table_name)
-        cached_data[table_name] = records
-        print(f"Loaded {len(records)} {table_name} records")
+    # Load every table at once; their batch requests share one bounded pool
+    table_names = list(GTFS_TO_TABLE.values())
+    print(f"\nLoading {', '.join(table_names)}...")
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as fetch_executor, \
+         ThreadPoolExecutor(max_workers=len(table_names)) as table_executor:
+        futures = [
+            table_executor.submit(load_table_data, supabase, table_name, '*', fetch_executor)
+            for table_name in table_names
+        ]
+        cached_data = {}
+        for table_name, future in zip(table_names, futures):
+            records = future.result()
+            cached_data[table_name] = records
+            print(f"Loaded {len(records)} {table_name} records")
     
     # Save to cache
     print("\nSaving to cache...")
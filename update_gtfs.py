@@ -10,28 +10,50 @@ Usage:
     python update_gtfs.py
 
 The script will:
-1. Download the latest GTFS data
+1. Download the latest GTFS data, stopping early if it is byte-identical
+   to the cached version
 2. Compare it with the cached version
 3. Apply any changes found
-4. Update the cache with the new data
+4. Update the cache by applying the same changes to it
 5. Start processing realtime updates
 
+Each step runs in this process rather than as a separate script.
+
 Dependencies:
 - requests: For downloading GTFS data
-- gtfs_zip_diff: For creating diffs
+- create_gtfs_diff: For creating diffs
 - apply_gtfs_diff: For applying diffs
+- hard_reset: For a full reset when there is no cached GTFS data
+- gtfs_realtime_parser: For processing realtime updates
 """
 
-import subprocess
+import hashlib
+import os
+import shutil
 import sys
 import tempfile
 import time
 import zipfile
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Optional
 
 import requests
+from apply_gtfs_diff import apply_diff_to_cache, process_diff_zip
 from create_gtfs_diff import create_diff_zip
+from gtfs_realtime_parser import parse_gtfs_realtime
+from hard_reset import reset_from_zip
+
+# 1 MB download chunks; 8 KB reads left the loop bound by Python overhead rather than the network
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Minimum seconds between download progress updates
+PROGRESS_INTERVAL = 0.1
+
+# Zip end-of-central-directory record: signature, minimum size, and how far
+# from the end of the file it can start (the record plus a maximum-length comment)
+ZIP_EOCD_SIGNATURE = b'PK\x05\x06'
+ZIP_EOCD_SIZE = 22
+ZIP_EOCD_SEARCH_SIZE = ZIP_EOCD_SIZE + 0xFFFF
 
 
 def ensure_temp_dir() -> Path:
@@ -68,15 +90,19 @@ def download_gtfs_zip(url: str, output_path: str) -> None:
         total_size = int(response.headers.get('content-length', 0))
         print(f"Total file size: {total_size} bytes")
         
-        block_size = 8192  # 8 KB chunks
+        block_size = DOWNLOAD_CHUNK_SIZE
         downloaded = 0
+        last_progress = 0.0
 
         with open(output_path, 'wb') as f:
             for data in response.iter_content(block_size):
                 downloaded += len(data)
                 f.write(data)
 
-                if total_size > 0:
+                # Throttle progress updates so printing never competes with the download
+                now = time.monotonic()
+                if total_size > 0 and (now - last_progress >= PROGRESS_INTERVAL or downloaded >= total_size):
+                    last_progress = now
                     percent = (downloaded / total_size) * 100
                     print(f"\rDownload progress: {percent:.1f}% ({downloaded}/{total_size} bytes)", end='')
 
@@ -106,43 +132,79 @@ def get_cached_gtfs_path() -> Optional[str]:
     return None
 
 
-def run_script(script_name: str, args: Optional[list] = None) -> bool:
+def file_sha256(file_path: str) -> str:
     """
-    Run a Python script and return whether it was successful.
+    Compute the SHA-256 digest of a file, reading it in 1 MB blocks.
 
     Args:
-        script_name: Name of the script to run
-        args: Optional list of arguments to pass to the script
+        file_path: Path to the file to hash
 
     Returns:
-        bool: True if the script ran successfully, False otherwise
+        Hex digest of the file's contents
     """
-    script_path = Path(__file__).parent / script_name
-    cmd = [sys.executable, str(script_path)]
-    if args:
-        cmd.extend(args)
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_step(step_name: str, step: Callable[..., Any], *args: Any) -> bool:
+    """
+    Run one step of the update in this process and return whether it was successful.
+
+    Steps that exit with sys.exit(), as they do when run as scripts, are
+    reported as failures rather than ending the update.
+
+    Args:
+        step_name: Name of the step, for progress output
+        step: Function to run
+        *args: Arguments to pass to the function
 
-    print(f"\n=== Running {script_name} ===")
+    Returns:
+        bool: True if the step ran successfully, False otherwise
+    """
+    print(f"\n=== Running {step_name} ===")
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        print(result.stdout)
+        step(*args)
         return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error running {script_name}:")
-        print(e.stderr)
+    except SystemExit as e:
+        if e.code in (None, 0):
+            return True
+        print(f"Error running {step_name}: exited with status {e.code}")
+        return False
+    except Exception as e:
+        print(f"Error running {step_name}: {str(e)}")
         return False
 
 
-def is_valid_zip(file_path: str) -> bool:
+def is_valid_zip(file_path: str, deep: bool = False) -> bool:
     """
     Check if a file is a valid ZIP file.
     
+    By default only the end of the file is read, looking for the zip's
+    end-of-central-directory record; a truncated download is missing it.
+    
     Args:
         file_path: Path to the file to check
+        deep: Open the file with zipfile and read its full central directory instead
         
     Returns:
         bool: True if the file is a valid ZIP file, False otherwise
     """
+    if not deep:
+        try:
+            with open(file_path, 'rb') as f:
+                size = f.seek(0, 2)
+                # The record is at least 22 bytes, followed by a comment of up to 64 KB
+                f.seek(max(0, size - ZIP_EOCD_SEARCH_SIZE))
+                tail = f.read()
+            eocd = tail.rfind(ZIP_EOCD_SIGNATURE)
+            return eocd != -1 and len(tail) - eocd >= ZIP_EOCD_SIZE
+        except OSError as e:
+            print(f"Error checking ZIP file {file_path}: {str(e)}")
+            return False
+    
     try:
         with zipfile.ZipFile(file_path) as zf:
             # Try to read the file list to verify it's a valid ZIP
@@ -176,9 +238,16 @@ def main():
         # Get path to cached GTFS data
         cached_gtfs_path = get_cached_gtfs_path()
 
+        # Nothing to do if the download is byte-identical to the cached zip, the last one applied
+        if (cached_gtfs_path is not None
+                and os.path.getsize(cached_gtfs_path) == latest_gtfs_path.stat().st_size
+                and file_sha256(cached_gtfs_path) == file_sha256(str(latest_gtfs_path))):
+            print("Downloaded GTFS data is unchanged since the last update.")
+            sys.exit(0)
+
         if cached_gtfs_path is None:
             print("No cached GTFS data found. Performing full reset...")
-            if not run_script("hard_reset.py", [str(latest_gtfs_path)]):
+            if not run_step("hard reset", reset_from_zip, latest_gtfs_path):
                 print("Failed to perform full reset.")
                 sys.exit(1)
         else:
@@ -194,26 +263,30 @@ def main():
                 has_changes = create_diff_zip(cached_gtfs_path, str(latest_gtfs_path), str(diff_zip_path))
                 if not has_changes:
                     print("No changes found in GTFS data.")
+                    # Keep the download as the base so an identical one is skipped next time
+                    shutil.copy2(latest_gtfs_path, cached_gtfs_path)
                     sys.exit(0)
             except Exception as e:
                 print(f"Failed to create diff zip: {str(e)}")
                 sys.exit(1)
 
-            # Apply diff using the script
+            # Apply diff
             print("\nApplying diff to database...")
-            if not run_script("apply_gtfs_diff.py", [str(diff_zip_path)]):
+            if not run_step("apply diff", process_diff_zip, str(diff_zip_path)):
                 print("Failed to apply diff.")
                 sys.exit(1)
 
-            # Update cache
+            # Update cache by applying the same diff to it, then make the new
+            # download the base for the next diff
             print("\nUpdating cache...")
-            if not run_script("load_gtfs_cache.py"):
+            if not run_step("update cache", apply_diff_to_cache, str(diff_zip_path)):
                 print("Failed to update cache.")
                 sys.exit(1)
+            shutil.copy2(latest_gtfs_path, cached_gtfs_path)
 
             # Process realtime updates
             print("\nProcessing realtime updates...")
-            if not run_script("gtfs_realtime_parser.py"):
+            if not run_step("realtime parser", parse_gtfs_realtime):
                 print("Failed to process realtime updates.")
                 sys.exit(1)
 